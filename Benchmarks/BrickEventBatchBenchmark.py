@@ -0,0 +1,83 @@
+# Replay of bricks which are placed on the board and swept off at once through Tracker.update
+# compares the messages written for the brick events one by one with one batch message per frame
+# Run from the repository root: python -m Benchmarks.BrickEventBatchBenchmark
+
+import json
+import time
+
+from LabTable.Configurator import Configurator
+from LabTable.TableContext import TableContext
+from LabTable.BrickDetection.BrickColorTable import BrickColorTable
+from LabTable.BrickDetection.Tracker import Tracker
+from LabTable.BrickHandling.BrickHandler import BrickHandler
+from LabTable.BrickHandling.WebSocket import WebSocketBrickHandler
+from LabTable.Model.Brick import Brick, Token, BrickShape, BrickColor
+from LabTable.Model.Extent import Extent
+from LabTable.Model.ProgramStage import ProgramStage
+
+BOARD_WIDTH = 1280
+BOARD_HEIGHT = 720
+BRICKS_NUMBER = 60
+ROUNDS_NUMBER = 20
+
+# frames with the bricks on the board and frames after they were swept off
+PLACED_FRAMES_NUMBER = 20
+SWEPT_FRAMES_NUMBER = 50
+
+TOKEN = Token(BrickShape.SQUARE_BRICK, BrickColor.RED_BRICK)
+
+
+# serializes the messages like the WebSocketBrickHandler and counts the writes instead of sending them
+class WritingBrickHandler(BrickHandler):
+
+    def __init__(self, batch_messages):
+        self.batch_messages = batch_messages
+        self.writes_number = 0
+        self.write_duration = 0.0
+
+    def write(self, message):
+        start = time.perf_counter()
+        json.dumps(message)
+        self.write_duration += time.perf_counter() - start
+        self.writes_number += 1
+
+    def handle_new_brick(self, brick):
+        self.write({"event": "brick_added", "data": WebSocketBrickHandler.get_brick_data(brick)})
+
+    def handle_removed_brick(self, brick):
+        self.write({"event": "brick_removed", "data": WebSocketBrickHandler.get_brick_data(brick)})
+
+    def handle_brick_batch(self, added_bricks, removed_bricks):
+
+        if not self.batch_messages:
+            super().handle_brick_batch(added_bricks, removed_bricks)
+            return
+
+        self.write({"event": "bricks_changed", "data": {
+            "added": [WebSocketBrickHandler.get_brick_data(brick) for brick in added_bricks],
+            "removed": [WebSocketBrickHandler.get_brick_data(brick) for brick in removed_bricks]}})
+
+
+if __name__ == '__main__':
+
+    config = Configurator()
+    config.set("brick_events", "batch_window", 0.0)
+    bricks_positions = [(20 + 20 * (idx % 60), 20 + 20 * (idx // 60)) for idx in range(BRICKS_NUMBER)]
+
+    for batch_messages in [False, True]:
+
+        context = TableContext()
+        context.extent_tracker.board = Extent.from_rectangle(0, 0, BOARD_WIDTH, BOARD_HEIGHT)
+        brick_handler = WritingBrickHandler(batch_messages)
+        tracker = Tracker(config, brick_handler, BrickColorTable(config), context)
+        tracker.allowed_tokens = [TOKEN]
+
+        for _ in range(ROUNDS_NUMBER):
+            for _ in range(PLACED_FRAMES_NUMBER):
+                tracker.update([Brick(x, y, TOKEN) for x, y in bricks_positions], ProgramStage.EXTERNAL_MODE)
+            for _ in range(SWEPT_FRAMES_NUMBER):
+                tracker.update([], ProgramStage.EXTERNAL_MODE)
+
+        print("{:13s}: {:5d} writes, {:6.2f} ms serializing".format(
+            "batch" if batch_messages else "single brick", brick_handler.writes_number,
+            brick_handler.write_duration * 1000))
@@ -0,0 +1,100 @@
+# Microbenchmark comparing the vectorized ShapeDetector.classify_color
+# with the former pixel by pixel hue histogram loop
+# Run from the repository root: python -m Benchmarks.ClassifyColorBenchmark
+
+import timeit
+
+import cv2
+import numpy as np
+
+from LabTable.Configurator import Configurator
+from LabTable.BrickDetection.ShapeDetector import ShapeDetector, HIST_SIZE
+from LabTable.BrickDetection.BrickColorTable import HUE, SATURATION
+from LabTable.Model.Brick import BrickColor
+
+FRAME_WIDTH = 1280
+FRAME_HEIGHT = 720
+BRICK_SIZE = 40
+BRICKS_NUMBER = 20
+REPETITIONS = 20
+
+# saturation range used by the former implementation
+MIN_SATURATION = 100
+MAX_SATURATION = 255
+
+# BGR colors matching the configured hue ranges
+BRICK_BGR_COLORS = [(0, 0, 200), (200, 60, 0), (0, 180, 0), (0, 200, 230)]
+
+
+# the former implementation of classify_color, kept here as reference
+def classify_color_loop(masks_configuration, bbox, frame):
+
+    frame_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    (left_x, upper_y, width, height) = bbox
+
+    new_width = int(width / 2)
+    new_height = int(height / 2)
+    new_left_x = left_x + int(new_width / 2)
+    new_upper_y = upper_y + int(new_height / 2)
+
+    hue_histogram = np.zeros(HIST_SIZE)
+    max_frequency = 0
+    most_frequent_hue_value = None
+    for x in range(new_width):
+        for y in range(new_height):
+            hsv_bbox = frame_hsv[new_upper_y + y, new_left_x + x]
+            if MIN_SATURATION <= hsv_bbox[SATURATION] <= MAX_SATURATION:
+                hue_histogram[hsv_bbox[HUE]] += 1
+                if hue_histogram[hsv_bbox[HUE]] > max_frequency:
+                    max_frequency = hue_histogram[hsv_bbox[HUE]]
+                    most_frequent_hue_value = hsv_bbox[HUE]
+
+    if most_frequent_hue_value is not None:
+        for mask_color, mask_config in masks_configuration.items():
+            for entry in mask_config:
+                if entry[0][HUE] <= most_frequent_hue_value <= entry[1][HUE]:
+                    return BrickColor[mask_color], most_frequent_hue_value
+
+    return BrickColor.UNKNOWN_COLOR, most_frequent_hue_value
+
+
+# create a noisy gray frame with some colored bricks and return it with the brick bounding boxes
+def create_frame(random_generator):
+
+    frame = random_generator.integers(90, 110, (FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+    bboxes = []
+    for brick_number in range(BRICKS_NUMBER):
+        x = int(random_generator.integers(0, FRAME_WIDTH - BRICK_SIZE))
+        y = int(random_generator.integers(0, FRAME_HEIGHT - BRICK_SIZE))
+        color = BRICK_BGR_COLORS[brick_number % len(BRICK_BGR_COLORS)]
+        cv2.rectangle(frame, (x, y), (x + BRICK_SIZE, y + BRICK_SIZE), color, cv2.FILLED)
+        bboxes.append((x, y, BRICK_SIZE, BRICK_SIZE))
+
+    return frame, bboxes
+
+
+if __name__ == '__main__':
+
+    config = Configurator()
+    masks_configuration = config.get("brick_colors")
+    shape_detector = ShapeDetector(config, None)
+    frame, bboxes = create_frame(np.random.default_rng(0))
+
+    # make sure both implementations agree before timing them
+    for bbox in bboxes:
+        vectorized = shape_detector.classify_color(bbox, frame)
+        loop = classify_color_loop(masks_configuration, bbox, frame)
+        if vectorized[0] != loop[0]:
+            print("color mismatch for {}: vectorized {} / loop {}".format(bbox, vectorized, loop))
+
+    loop_time = timeit.timeit(
+        lambda: [classify_color_loop(masks_configuration, bbox, frame) for bbox in bboxes],
+        number=REPETITIONS) / REPETITIONS
+    vectorized_time = timeit.timeit(
+        lambda: [shape_detector.classify_color(bbox, frame) for bbox in bboxes],
+        number=REPETITIONS) / REPETITIONS
+
+    print("{} bricks of {}x{} px per frame".format(BRICKS_NUMBER, BRICK_SIZE, BRICK_SIZE))
+    print("loop:       {:8.2f} ms per frame".format(loop_time * 1000))
+    print("vectorized: {:8.2f} ms per frame".format(vectorized_time * 1000))
+    print("speedup:    {:8.1f}x".format(loop_time / vectorized_time))
@@ -0,0 +1,120 @@
+# Benchmark comparing the contours and color_segmentation brick detection backends
+# on the same frames (per frame time and detection agreement)
+# Run from the repository root: python -m Benchmarks.DetectionBackendBenchmark [--frames video_or_image_pattern]
+# Without --frames synthetic frames with randomly placed bricks are used
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from LabTable.Configurator import Configurator
+from LabTable.BrickDetection.ShapeDetector import ShapeDetector, DetectionBackend
+from LabTable.BrickDetection.FrameCache import FrameCache
+
+# distance to the board (in depth units) used to compute the possible brick dimensions
+BOARD_DISTANCE = 1000
+SYNTHETIC_FRAMES_NUMBER = 30
+SYNTHETIC_BRICKS_NUMBER = 40
+FRAME_WIDTH = 1280
+FRAME_HEIGHT = 720
+# maximum centroid distance in pixels for two detections to be considered the same brick
+AGREEMENT_DISTANCE = 6
+
+BRICK_BGR_COLORS = [(0, 0, 200), (200, 60, 0), (0, 180, 0)]
+
+
+# create noisy frames with randomly placed and rotated bricks
+def create_synthetic_frames(brick_short_side):
+
+    random_generator = np.random.default_rng(0)
+    frames = []
+    for _ in range(SYNTHETIC_FRAMES_NUMBER):
+        frame = random_generator.integers(90, 110, (FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+        for brick_number in range(SYNTHETIC_BRICKS_NUMBER):
+            center = (float(random_generator.integers(50, FRAME_WIDTH - 50)),
+                      float(random_generator.integers(50, FRAME_HEIGHT - 50)))
+            size = (brick_short_side * int(random_generator.integers(1, 3)), brick_short_side)
+            box = cv2.boxPoints((center, size, float(random_generator.integers(0, 90)))).astype(np.int32)
+            cv2.fillPoly(frame, [box], BRICK_BGR_COLORS[brick_number % len(BRICK_BGR_COLORS)])
+        frames.append(frame)
+
+    return frames
+
+
+# read all frames of a video file or image sequence
+def read_frames(path):
+
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        success, frame = capture.read()
+        if not success:
+            break
+        frames.append(frame)
+    capture.release()
+
+    return frames
+
+
+# count the bricks which were found by both backends with the same token
+def count_agreements(bricks, other_bricks):
+
+    agreements = 0
+    unmatched = list(other_bricks)
+    for brick in bricks:
+        for other_brick in unmatched:
+            if brick.token == other_brick.token \
+                    and abs(brick.centroid_x - other_brick.centroid_x) <= AGREEMENT_DISTANCE \
+                    and abs(brick.centroid_y - other_brick.centroid_y) <= AGREEMENT_DISTANCE:
+                unmatched.remove(other_brick)
+                agreements += 1
+                break
+
+    return agreements
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", help="video file or image sequence (e.g. frames/%%04d.png) of rectified boards")
+    parser.add_argument("--distance", type=float, default=BOARD_DISTANCE, help="distance to the board")
+    arguments = parser.parse_args()
+
+    config = Configurator()
+    detectors = {}
+    for backend in DetectionBackend:
+        config.set("brick_detection", "backend", backend.value)
+        detectors[backend] = ShapeDetector(config, None, FrameCache())
+        detectors[backend].calculate_possible_brick_dimensions(arguments.distance)
+
+    if arguments.frames:
+        frames = read_frames(arguments.frames)
+    else:
+        frames = create_synthetic_frames(int(detectors[DetectionBackend.CONTOURS].min_square_length) + 1)
+
+    durations = {backend: 0.0 for backend in DetectionBackend}
+    detections = {backend: 0 for backend in DetectionBackend}
+    agreements = 0
+
+    for frame in frames:
+        frame_bricks = {}
+        for backend, detector in detectors.items():
+
+            # copy the frame so that no derived image of the other backend is reused
+            frame_copy = frame.copy()
+            start = time.perf_counter()
+            frame_bricks[backend], _ = detector.detect_frame(frame_copy)
+            durations[backend] += time.perf_counter() - start
+            detections[backend] += len(frame_bricks[backend])
+
+        agreements += count_agreements(frame_bricks[DetectionBackend.CONTOURS],
+                                       frame_bricks[DetectionBackend.COLOR_SEGMENTATION])
+
+    print("{} frames".format(len(frames)))
+    for backend in DetectionBackend:
+        print("{:20s} {:8.2f} ms per frame, {:6.1f} bricks per frame".format(
+            backend.value, durations[backend] * 1000 / len(frames), detections[backend] / len(frames)))
+    print("bricks found by both backends: {} ({:.1%} of all distinct detections)".format(
+        agreements, agreements / max(1, sum(detections.values()) - agreements)))
@@ -0,0 +1,74 @@
+# Microbenchmark comparing the per-frame cost of BoardDetector.rectify_image using cached remap tables
+# with the former implementation, which computed the perspective transform for every frame
+# and copied the warped image into the region of interest buffer
+# Run from the repository root: python -m Benchmarks.RectificationBenchmark
+
+import timeit
+
+import cv2
+import numpy as np
+
+from LabTable.Configurator import Configurator
+from LabTable.BrickDetection.BoardDetector import BoardDetector
+from LabTable.TableContext import TableContext
+
+FRAME_WIDTH = 1280
+FRAME_HEIGHT = 720
+REPETITIONS = 100
+
+# board corners (top left, top right, bottom right, bottom left) as seen by a slightly tilted camera
+CORNERS = [[142.0, 96.0], [1131.0, 83.0], [1158.0, 652.0], [121.0, 640.0]]
+
+
+# the former implementation of rectify_image, kept here as reference
+def rectify_image_legacy(region_of_interest, color_image, corners, board_width, board_height):
+
+    source_corners = np.zeros((4, 2), dtype="float32")
+    source_corners[0] = corners[0]
+    source_corners[1] = corners[1]
+    source_corners[2] = corners[2]
+    source_corners[3] = corners[3]
+
+    destination_corners = np.array([
+        [0, 0],
+        [board_width - 1, 0],
+        [board_width - 1, board_height - 1],
+        [0, board_height - 1]], dtype="float32")
+
+    matrix = cv2.getPerspectiveTransform(source_corners, destination_corners)
+    rectified_image = cv2.warpPerspective(color_image, matrix, (board_width, board_height))
+    region_of_interest[0:board_height, 0:board_width] = rectified_image
+
+    return region_of_interest[0:board_height, 0:board_width]
+
+
+if __name__ == '__main__':
+
+    config = Configurator()
+    board_detector = BoardDetector(config, TableContext())
+    board_detector.board.corners = CORNERS
+    min_x, min_y, max_x, max_y = board_detector.find_min_max(CORNERS)
+    board_detector.board.width = int(max_x - min_x)
+    board_detector.board.height = int(max_y - min_y)
+
+    color_image = np.random.default_rng(0).integers(0, 256, (FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+    color_image = cv2.GaussianBlur(color_image, (5, 5), 0)
+    region_of_interest = np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 3), np.uint8)
+
+    # make sure both implementations agree before timing them
+    legacy = rectify_image_legacy(region_of_interest, color_image, CORNERS,
+                                  board_detector.board.width, board_detector.board.height)
+    cached = board_detector.rectify_image(color_image)
+    difference = np.abs(legacy.astype(int) - cached.astype(int))
+    print("maximum difference {}, mean difference {:.3f}".format(difference.max(), difference.mean()))
+
+    legacy_time = timeit.timeit(
+        lambda: rectify_image_legacy(region_of_interest, color_image, CORNERS,
+                                     board_detector.board.width, board_detector.board.height),
+        number=REPETITIONS) / REPETITIONS
+    cached_time = timeit.timeit(lambda: board_detector.rectify_image(color_image), number=REPETITIONS) / REPETITIONS
+
+    print("board of {}x{} px".format(board_detector.board.width, board_detector.board.height))
+    print("legacy: {:8.2f} ms per frame".format(legacy_time * 1000))
+    print("cached: {:8.2f} ms per frame".format(cached_time * 1000))
+    print("speedup:{:8.1f}x".format(legacy_time / cached_time))
@@ -0,0 +1,60 @@
+# Scaling benchmark of the tile parallel brick detection over 1, 2, 4 and 8 workers
+# Run from the repository root: python -m Benchmarks.TileParallelBenchmark [--frames video_or_image_pattern]
+# Without --frames synthetic frames with randomly placed bricks are used
+
+import argparse
+import time
+
+from LabTable.Configurator import Configurator
+from LabTable.BrickDetection.ShapeDetector import ShapeDetector, DetectionBackend
+from LabTable.BrickDetection.FrameCache import FrameCache
+from Benchmarks.DetectionBackendBenchmark import BOARD_DISTANCE, create_synthetic_frames, read_frames
+
+WORKERS = [1, 2, 4, 8]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", help="video file or image sequence (e.g. frames/%%04d.png) of rectified boards")
+    parser.add_argument("--distance", type=float, default=BOARD_DISTANCE, help="distance to the board")
+    parser.add_argument("--backend", default=DetectionBackend.CONTOURS.value,
+                        choices=[backend.value for backend in DetectionBackend])
+    arguments = parser.parse_args()
+
+    config = Configurator()
+    config.set("brick_detection", "backend", arguments.backend)
+
+    frames = None
+    reference_bricks = None
+    reference_time = None
+
+    for workers in WORKERS:
+        config.set("brick_detection", "workers", workers)
+        detector = ShapeDetector(config, None, FrameCache())
+        detector.calculate_possible_brick_dimensions(arguments.distance)
+
+        if frames is None:
+            if arguments.frames:
+                frames = read_frames(arguments.frames)
+            else:
+                frames = create_synthetic_frames(int(detector.min_square_length) + 1)
+
+        frame_bricks = []
+        duration = 0.0
+        for frame in frames:
+            frame_copy = frame.copy()
+            start = time.perf_counter()
+            bricks, _ = detector.detect_frame(frame_copy)
+            duration += time.perf_counter() - start
+            frame_bricks.append(sorted(str(brick) for brick in bricks))
+
+        detector.close()
+
+        # the first run is the reference for speedup and detected bricks
+        if reference_bricks is None:
+            reference_bricks = frame_bricks
+            reference_time = duration
+
+        print("{} workers: {:8.2f} ms per frame, speedup {:4.2f}x, same bricks as 1 worker: {}".format(
+            workers, duration * 1000 / len(frames), reference_time / duration, frame_bricks == reference_bricks))
@@ -0,0 +1,92 @@
+# Replay of jittered detections of static bricks and some transient false detections through Tracker.update
+# reports the time per frame, the size of the tracker state and the add/remove events sent for the bricks
+# Run from the repository root: python -m Benchmarks.TrackerAssociationBenchmark
+
+import time
+
+import numpy as np
+
+from LabTable.Configurator import Configurator
+from LabTable.TableContext import TableContext
+from LabTable.BrickDetection.BrickColorTable import BrickColorTable
+from LabTable.BrickDetection.Tracker import Tracker
+from LabTable.BrickHandling.BrickHandler import BrickHandler
+from LabTable.Model.Brick import Brick, Token, BrickShape, BrickColor
+from LabTable.Model.Extent import Extent
+from LabTable.Model.ProgramStage import ProgramStage
+
+BOARD_WIDTH = 1280
+BOARD_HEIGHT = 720
+BRICKS_NUMBER = 40
+FRAMES_NUMBER = 20000
+REPORT_INTERVAL = 2000
+
+# standard deviation of the centroid jitter in pixels and probability that a brick is detected in a frame
+JITTER = 1.0
+DETECTION_PROBABILITY = 0.95
+
+# number of false detections at random positions per frame (e.g. hands or shadows)
+FALSE_DETECTIONS_NUMBER = 3
+
+TOKENS = [Token(BrickShape.SQUARE_BRICK, BrickColor.RED_BRICK), Token(BrickShape.RECTANGLE_BRICK, BrickColor.BLUE_BRICK)]
+
+
+# counts the events the tracker sends
+class CountingBrickHandler(BrickHandler):
+
+    def __init__(self):
+        self.added_number = 0
+        self.removed_number = 0
+
+    def handle_new_brick(self, brick):
+        self.added_number += 1
+
+    def handle_removed_brick(self, brick):
+        self.removed_number += 1
+
+
+if __name__ == '__main__':
+
+    config = Configurator()
+    context = TableContext()
+    context.extent_tracker.board = Extent.from_rectangle(0, 0, BOARD_WIDTH, BOARD_HEIGHT)
+
+    brick_handler = CountingBrickHandler()
+    tracker = Tracker(config, brick_handler, BrickColorTable(config), context)
+    tracker.allowed_tokens = TOKENS
+
+    # static bricks spread over the board at least a few min_distances apart
+    rng = np.random.default_rng(0)
+    positions = np.stack([rng.permutation(np.arange(50, BOARD_WIDTH - 50, 30))[:BRICKS_NUMBER],
+                          rng.integers(50, BOARD_HEIGHT - 50, BRICKS_NUMBER)], axis=1)
+
+    durations = []
+    for frame in range(FRAMES_NUMBER):
+
+        jittered_positions = np.rint(positions + rng.normal(0, JITTER, positions.shape)).astype(int)
+        detected = rng.random(BRICKS_NUMBER) < DETECTION_PROBABILITY
+        bricks = [Brick(int(x), int(y), TOKENS[idx % len(TOKENS)])
+                  for idx, (x, y) in enumerate(jittered_positions) if detected[idx]]
+        bricks += [Brick(int(x), int(y), TOKENS[0]) for x, y in zip(
+            rng.integers(0, BOARD_WIDTH, FALSE_DETECTIONS_NUMBER), rng.integers(0, BOARD_HEIGHT, FALSE_DETECTIONS_NUMBER))]
+
+        start = time.perf_counter()
+        tracker.update(bricks, ProgramStage.EXTERNAL_MODE)
+        durations.append(time.perf_counter() - start)
+
+        if (frame + 1) % REPORT_INTERVAL == 0:
+            print("frame {:6d}: {:.3f} ms per frame, {}".format(
+                frame + 1, np.mean(durations[-REPORT_INTERVAL:]) * 1000,
+                ", ".join("{} {}".format(value, name) for name, value in tracker.get_statistics().items())))
+
+    print("{} bricks, {} false detections per frame, {} frames, jitter {} px".format(
+        BRICKS_NUMBER, FALSE_DETECTIONS_NUMBER, FRAMES_NUMBER, JITTER))
+    print("events: {} added, {} removed".format(brick_handler.added_number, brick_handler.removed_number))
+
+    # compare the sent and the current positions of the confirmed bricks with the true positions
+    sent_positions = np.array([brick.relative_position for brick in tracker.confirmed_bricks]) * [BOARD_WIDTH,
+                                                                                                  BOARD_HEIGHT]
+    current_positions = np.array([[brick.centroid_x, brick.centroid_y] for brick in tracker.confirmed_bricks])
+    for name, brick_positions in [("sent", sent_positions), ("current", current_positions)]:
+        errors = np.linalg.norm(brick_positions[:, np.newaxis] - positions[np.newaxis], axis=2).min(axis=1)
+        print("{} position error: mean {:.2f} px, max {:.2f} px".format(name, errors.mean(), errors.max()))
@@ -0,0 +1,75 @@
+# Microbenchmark comparing the neighbour lookups of the Tracker on the SpatialGrid of the BrickStore
+# with the former linear scan over the list of confirmed bricks for a growing number of bricks
+# Run from the repository root: python -m Benchmarks.TrackerNeighbourBenchmark
+
+import timeit
+
+import numpy as np
+
+from LabTable.Configurator import Configurator
+from LabTable.BrickDetection.BrickColorTable import BrickColorTable
+from LabTable.BrickDetection.Tracker import Tracker
+from LabTable.BrickHandling.BrickHandler import BrickHandler
+from LabTable.TableContext import TableContext
+from LabTable.Model.Brick import Brick, Token, BrickShape, BrickColor
+
+BOARD_WIDTH = 1280
+BOARD_HEIGHT = 720
+BRICKS_NUMBERS = [10, 100, 1000, 5000]
+QUERIES_NUMBER = 200
+REPETITIONS = 20
+
+TOKEN = Token(BrickShape.SQUARE_BRICK, BrickColor.RED_BRICK)
+
+
+# the former implementation of check_min_distance, kept here as reference
+def check_min_distance_legacy(brick, bricks_list, min_distance):
+
+    for potential_neighbour in bricks_list:
+
+        distance_x = abs(potential_neighbour.centroid_x - brick.centroid_x)
+        distance_y = abs(potential_neighbour.centroid_y - brick.centroid_y)
+
+        if (distance_x <= min_distance) & (distance_y <= min_distance):
+            return potential_neighbour
+
+    return None
+
+
+# create bricks at random positions on the board
+def create_bricks(rng, number):
+    return [Brick(int(x), int(y), TOKEN) for x, y in zip(rng.integers(0, BOARD_WIDTH, number),
+                                                         rng.integers(0, BOARD_HEIGHT, number))]
+
+
+if __name__ == '__main__':
+
+    config = Configurator()
+    tracker = Tracker(config, BrickHandler(), BrickColorTable(config), TableContext())
+    rng = np.random.default_rng(0)
+    queries = create_bricks(rng, QUERIES_NUMBER)
+
+    print("min_distance {} px, {} queries per frame".format(tracker.min_distance, QUERIES_NUMBER))
+
+    for bricks_number in BRICKS_NUMBERS:
+
+        bricks = create_bricks(rng, bricks_number)
+        tracker.confirmed_bricks.clear()
+        for brick in bricks:
+            tracker.confirmed_bricks.add(brick)
+
+        # make sure both implementations agree on whether a neighbour exists before timing them
+        for query in queries:
+            legacy = check_min_distance_legacy(query, bricks, tracker.min_distance)
+            grid = tracker.check_min_distance(query, tracker.confirmed_bricks)
+            assert (legacy is None) == (grid is None)
+
+        legacy_time = timeit.timeit(
+            lambda: [check_min_distance_legacy(query, bricks, tracker.min_distance) for query in queries],
+            number=REPETITIONS) / REPETITIONS
+        grid_time = timeit.timeit(
+            lambda: [tracker.check_min_distance(query, tracker.confirmed_bricks) for query in queries],
+            number=REPETITIONS) / REPETITIONS
+
+        print("{:5d} bricks: legacy {:8.3f} ms, grid {:8.3f} ms, speedup {:6.1f}x".format(
+            bricks_number, legacy_time * 1000, grid_time * 1000, legacy_time / grid_time))
@@ -1,12 +1,16 @@
 import pyzbar.pyzbar as pyzbar
+from pyzbar.locations import Point, Rect
 import cv2
 import numpy as np
 import math
-from shapely import geometry
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import permutations
 import logging.config
 
 from LabTable.TableOutputStream import TableOutputStream, TableOutputChannel
-from LabTable.ExtentTracker import ExtentTracker
+from LabTable.ImageHandler import ImageHandler
+from LabTable.TableContext import TableContext
 from LabTable.Model.Extent import Extent
 from LabTable.Model.Board import Board
 
@@ -17,9 +21,12 @@ logger = logging.getLogger(__name__)
 CLIP = 0.1
 
 # Number of frames for computing background average
-MIN_LOOP_NUMBER = 5
+MIN_LOOP_NUMBER = 3
 MAX_LOOP_NUMBER = 30
 
+# Scale of the downscaled running average which is checked for convergence
+CONVERGENCE_SCALE = 0.25
+
 # accumulate weighted parameter
 INPUT_WEIGHT = 0.5
 
@@ -27,16 +34,44 @@ INPUT_WEIGHT = 0.5
 # with the THRESH_BINARY
 MAX_VALUE = 255
 
+# Data of the QR-codes in the order of all_codes_polygons_points and of the frame quadrants
+# [top left, top right, bottom right, bottom left]
+QR_CODE_NAMES = ["TL", "TR", "BR", "BL"]
+
+# Share of the frame size by which the quadrants overlap the middle of the frame
+QUADRANT_OVERLAP = 0.1
+
+# Scale of the first decoding pass of a quadrant
+DOWNSCALED_PASS_SCALE = 0.5
+
+# Names of the QR-code resources in the order of QR_CODE_NAMES
+QR_CODE_RESOURCES = ["qr_top_left", "qr_top_right", "qr_bottom_right", "qr_bottom_left"]
+
+# Minimum number of QR-codes needed to fit the board homography
+# and number of frames without a newly found code after which the board is calibrated with less than four codes
+MIN_CODES_NUMBER = 3
+MAX_MISSING_CODE_FRAMES = 10
+
+# Maximum reprojection error in pixels of a QR-code point to be an inlier of the board homography
+RANSAC_REPROJECTION_THRESHOLD = 3.0
+MIN_INLIERS_NUMBER = 8
+
+# Sub-pixel refinement of the QR-code points
+SUBPIX_WINDOW_SIZE = (5, 5)
+SUBPIX_ZERO_ZONE = (-1, -1)
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+
 
 # this class manages the extent to detect and reference the extent of
 # the board related to the video stream
 class BoardDetector:
     background = None
-    last_color_image = None
+    last_small_background = None
 
-    def __init__(self, config):
+    def __init__(self, config, context: TableContext):
 
         self.config = config
+        self.context = context
 
         # Initialize the board
         self.board = Board()
@@ -44,16 +79,34 @@ class BoardDetector:
         # Array with all polygons of QR-Codes for board corners
         self.all_codes_polygons_points = [None, None, None, None]
         self.found_codes_number = 0
-        self.code_found_flag = False
+
+        # Polygons of the QR-codes on the beamer image in the order of all_codes_polygons_points
+        self.beamer_codes_polygons_points = None
 
         # Get the resolution from config file
         self.frame_width = self.config.get("video_resolution", "width")
         self.frame_height = self.config.get("video_resolution", "height")
 
+        # Mean absolute change (gray values) between two running averages at which the background is stable
+        self.background_tolerance = self.config.get("white_balance", "tolerance")
         self.current_loop = 0
+        self.background_start_time = None
 
         self.detect_corners_frames_number = 0
 
+        # decode the QR-codes in the four quadrants of the frame in parallel
+        # and try to find them on a downscaled quadrant first if configured
+        self.qr_code_executor = ThreadPoolExecutor(max_workers=len(QR_CODE_NAMES), thread_name_prefix="QRCodes")
+        self.downscaled_pass = self.config.get("qr_code", "downscaled_pass")
+
+        # the corners and board size the remap tables were computed for
+        self.rectification_key = None
+        self.rectification_maps = None
+
+        # preallocated buffers for the rectified color and depth images
+        self.rectified_image = None
+        self.rectified_depth = None
+
     # Compute pythagoras value
     @staticmethod
     def pythagoras(value_x, value_y):
@@ -74,85 +127,6 @@ class BoardDetector:
         # Return distance between two points
         return distance
 
-    # Compute normal vector
-    @staticmethod
-    def normal_vector(point1, point2):
-        distance = BoardDetector.calculate_distance(point1[0], point1[1], point2[0], point2[1])
-        normal_vector_x = (point1[0] - point2[0]) / distance
-        normal_vector_y = (point1[1] - point2[1]) / distance
-
-        # Return normal vector
-        return normal_vector_x, normal_vector_y
-
-    # Compute position of diagonal board corners, based on position of qr-codes centroids
-    def set_corners(self, qrcode_points, centroid1, centroid2, centroid_corner_distance):
-
-        corner1 = [0, 0]
-        corner2 = [0, 0]
-
-        # TODO: write a function
-        # Compute vector of length 1 for diagonal of board corners (between two centroids)
-        board_diagonal_normal_vector = self.normal_vector(centroid1, centroid2)
-
-        # Compute vector of length 1 for both diagonals of a qr_code square and choose the right one
-        # Compute vector of length 1 for the first diagonal
-        qrcode_diagonal1_normal_vector = self.normal_vector(qrcode_points[0], qrcode_points[2])
-
-        # Compute vector of length 1 for the second diagonal
-        qrcode_diagonal2_normal_vector = self.normal_vector(qrcode_points[1], qrcode_points[3])
-
-        # Choose the right diagonal, must have the same sign as the diagonal of given board corners
-        # Minus * Minus -> Plus
-        # Plus * Plus -> Plus
-        # Plus * Minus -> Minus
-        # If the product is > 0, it is the right diagonal of the qrcode
-        if board_diagonal_normal_vector[0] * qrcode_diagonal1_normal_vector[0] * \
-                board_diagonal_normal_vector[1] * qrcode_diagonal1_normal_vector[1] > 0:
-            diagonal = qrcode_diagonal1_normal_vector
-        else:
-            diagonal = qrcode_diagonal2_normal_vector
-
-        # Compute vectors of length = centroid_corner_distance for diagonal direction
-        diagonal_vector_x = diagonal[0] * centroid_corner_distance
-        diagonal_vector_y = diagonal[1] * centroid_corner_distance
-
-        # Ensure that vectors are positive in x and y directions
-        diagonal_vector_x = self.pythagoras(diagonal_vector_x, 0)
-        diagonal_vector_y = self.pythagoras(diagonal_vector_y, 0)
-
-        # Compute position of corners (distance between corners must be bigger than between centroids)
-        if centroid1[0] < centroid2[0]:
-            corner1[0] = centroid1[0] - diagonal_vector_x
-            corner2[0] = centroid2[0] + diagonal_vector_x
-        else:
-            corner1[0] = centroid1[0] + diagonal_vector_x
-            corner2[0] = centroid2[0] - diagonal_vector_x
-
-        if centroid1[1] < centroid2[1]:
-            corner1[1] = centroid1[1] - diagonal_vector_y
-            corner2[1] = centroid2[1] + diagonal_vector_y
-        else:
-            corner1[1] = centroid1[1] + diagonal_vector_y
-            corner2[1] = centroid2[1] - diagonal_vector_y
-
-        # Cast to int
-        corner1[0] = int(corner1[0])
-        corner1[1] = int(corner1[1])
-        corner2[0] = int(corner2[0])
-        corner2[1] = int(corner2[1])
-
-        # Do not allow for position lower than 0
-        if corner1[0] < 0:
-            corner1[0] = 0
-        if corner1[1] < 0:
-            corner1[1] = 0
-        if corner2[0] < 0:
-            corner2[0] = 0
-        if corner2[1] < 0:
-            corner2[1] = 0
-
-        return corner1, corner2
-
     # Save four polygons of QR-Codes decoded over couple of frames and read metadata
     def read_qr_codes(self, decoded_codes):
 
@@ -164,35 +138,95 @@ class BoardDetector:
 
             # If data in array with top left, top right, bottom right, bottom left
             # data is not set yet, add the new found data
-            if "TL" in code_data and self.all_codes_polygons_points[0] is None:
-                self.all_codes_polygons_points[0] = code.polygon
-                logger.debug("detected TL at {}".format(code.polygon))
-            if "TR" in code_data and self.all_codes_polygons_points[1] is None:
-                self.all_codes_polygons_points[1] = code.polygon
-                logger.debug("detected TR at {}".format(code.polygon))
-            if "BR" in code_data and self.all_codes_polygons_points[2] is None:
-                self.all_codes_polygons_points[2] = code.polygon
-                logger.debug("detected BL at {}".format(code.polygon))
-            if "BL" in code_data and self.all_codes_polygons_points[3] is None:
-                self.all_codes_polygons_points[3] = code.polygon
-                logger.debug("detected BR at {}".format(code.polygon))
+            for code_idx, code_name in enumerate(QR_CODE_NAMES):
+                if code_name in code_data and self.all_codes_polygons_points[code_idx] is None:
+                    self.all_codes_polygons_points[code_idx] = code.polygon
+                    logger.debug("detected {} at {}".format(code_name, code.polygon))
 
-    # Detect the board using four QR-Codes in the board corners
-    def detect_board(self, color_image, output_stream: TableOutputStream):
+    # Return the (x, y, width, height) bounding boxes of the frame quadrants in the order of QR_CODE_NAMES
+    # the quadrants overlap the middle of the frame, so that codes near the middle are not cut
+    @staticmethod
+    def get_quadrants(frame_width, frame_height):
+
+        half_width = frame_width // 2
+        half_height = frame_height // 2
+        overlap_x = int(frame_width * QUADRANT_OVERLAP)
+        overlap_y = int(frame_height * QUADRANT_OVERLAP)
+
+        left = (0, half_width + overlap_x)
+        right = (half_width - overlap_x, frame_width)
+        top = (0, half_height + overlap_y)
+        bottom = (half_height - overlap_y, frame_height)
+
+        return [(x_range[0], y_range[0], x_range[1] - x_range[0], y_range[1] - y_range[0])
+                for x_range, y_range in [(left, top), (right, top), (right, bottom), (left, bottom)]]
+
+    # Decode the QR-codes in a quadrant of the frame
+    # returns the thresholded quadrant and the decoded codes with polygons in frame coordinates
+    def decode_quadrant(self, color_image, quadrant, code_name):
+
+        x, y, width, height = quadrant
+        color_quadrant = color_image[y:y + height, x:x + width]
+        background_quadrant = self.background[y:y + height, x:x + width]
 
         # Compute difference between background and the current frame
-        diff = cv2.absdiff(color_image, self.background.astype("uint8"))
+        diff = cv2.absdiff(color_quadrant, background_quadrant.astype("uint8"))
         diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
         ret_val, diff = cv2.threshold(diff, 0, MAX_VALUE, cv2.THRESH_OTSU)
 
         # Invert image
         looking_for_qr_code_image = 255 - diff
 
-        # Decode QR or Bar-Codes from both black-white and color image
-        decoded_codes = pyzbar.decode(looking_for_qr_code_image)
+        # Try to decode the code on a downscaled quadrant first, which is cheaper
+        scale = 1
+        decoded_codes = []
+        if self.downscaled_pass:
+            small_image = cv2.resize(looking_for_qr_code_image, None, fx=DOWNSCALED_PASS_SCALE,
+                                     fy=DOWNSCALED_PASS_SCALE, interpolation=cv2.INTER_AREA)
+            decoded_codes = pyzbar.decode(small_image)
+            scale = DOWNSCALED_PASS_SCALE
+
+        # Decode QR-codes in full resolution if the searched code was not found
+        if not any(code_name in code.data.decode() for code in decoded_codes):
+            decoded_codes = pyzbar.decode(looking_for_qr_code_image)
+            scale = 1
+
+        # Move the codes to frame coordinates
+        decoded_codes = [self.move_code(code, scale, x, y) for code in decoded_codes]
+
+        return looking_for_qr_code_image, decoded_codes
+
+    # Scale a decoded code back to the size of the quadrant and move it by the offset of the quadrant
+    @staticmethod
+    def move_code(code, scale, offset_x, offset_y):
+
+        polygon = [Point(int(round(point.x / scale)) + offset_x, int(round(point.y / scale)) + offset_y)
+                   for point in code.polygon]
+        rect = Rect(int(round(code.rect.left / scale)) + offset_x, int(round(code.rect.top / scale)) + offset_y,
+                    int(round(code.rect.width / scale)), int(round(code.rect.height / scale)))
+
+        return code._replace(polygon=polygon, rect=rect)
+
+    # Detect the board using four QR-Codes in the board corners
+    def detect_board(self, color_image, output_stream: TableOutputStream):
+
+        # Decode only the quadrants whose code was not found yet, each of them in its own thread
+        quadrants = self.get_quadrants(color_image.shape[1], color_image.shape[0])
+        searched_quadrants = [(quadrant, code_name) for quadrant, code_name, code_polygon
+                              in zip(quadrants, QR_CODE_NAMES, self.all_codes_polygons_points)
+                              if code_polygon is None]
+        results = list(self.qr_code_executor.map(lambda searched: self.decode_quadrant(color_image, *searched),
+                                                 searched_quadrants))
+
+        # Show the thresholded searched quadrants on the color image
+        looking_for_qr_code_image = color_image.copy()
+        decoded_codes = []
+        for ((x, y, width, height), _), (thresholded_quadrant, quadrant_codes) in zip(searched_quadrants, results):
+            looking_for_qr_code_image[y:y + height, x:x + width] = \
+                cv2.cvtColor(thresholded_quadrant, cv2.COLOR_GRAY2BGR)
+            decoded_codes += quadrant_codes
 
         # Mark found QR-codes on the color image and display it in the qr channel
-        looking_for_qr_code_image = cv2.cvtColor(looking_for_qr_code_image, cv2.COLOR_GRAY2BGR)
         self.display_found_codes(looking_for_qr_code_image, decoded_codes)
         output_stream.write_to_channel(TableOutputChannel.CHANNEL_QR_DETECTION, looking_for_qr_code_image)
 
@@ -200,72 +234,176 @@ class BoardDetector:
         # save polygons in the array self.board_detector.all_codes_polygons_points and read metadata
         self.read_qr_codes(decoded_codes)
 
-        top_left_corner = None
-        top_right_corner = None
-        bottom_right_corner = None
-        bottom_left_corner = None
-        centroids = []
-        all_board_corners_found = False
-        centroid_corner_distance = None
-
         # Count found qr-codes
         self.board.found_codes_number = sum(code is not None for code in self.all_codes_polygons_points)
 
-        # Update the flag
+        # Count the frames since the last newly found code
         if self.board.found_codes_number > self.found_codes_number:
-
             self.found_codes_number = self.board.found_codes_number
-            if self.code_found_flag is False:
-                self.code_found_flag = True
-                self.detect_corners_frames_number = 0
+            self.detect_corners_frames_number = 0
+        else:
+            self.detect_corners_frames_number += 1
+
+        # Continue if all codes or at least MIN_CODES_NUMBER codes and no new ones for a while were found
+        if self.found_codes_number == len(QR_CODE_NAMES) or \
+                (self.found_codes_number >= MIN_CODES_NUMBER
+                 and self.detect_corners_frames_number >= MAX_MISSING_CODE_FRAMES):
+            return self.calibrate_board(color_image)
+
+        return False
+
+    # Fit the homography from the beamer image to the camera frame over all points of the found QR-codes
+    # and derive the board corners, the board size and the rectification matrix from it
+    # returns true if the board was calibrated
+    def calibrate_board(self, color_image):
+
+        gray_image = cv2.cvtColor(color_image, cv2.COLOR_BGR2GRAY)
+        matrix = self.fit_board_homography(self.all_codes_polygons_points, gray_image)
+        if matrix is None:
+            return False
+
+        self.set_board_homography(matrix)
+        logger.info("calibrated the board with {} codes".format(self.found_codes_number))
+        logger.info("all board corners found: {}".format(self.board.corners))
+
+        return True
+
+    # Fit the homography from the beamer image to the camera frame over all points of the given QR-code polygons
+    # (in the order of QR_CODE_NAMES, None for codes which were not found) and refine the points in the gray image
+    # returns None if not enough codes were found or no homography could be fitted
+    def fit_board_homography(self, codes_polygons_points, gray_image):
+
+        beamer_codes_polygons_points = self.get_beamer_codes_polygons_points()
+        if beamer_codes_polygons_points is None:
+            return None
+
+        found_codes = [(np.array(camera_points, np.float32), np.array(beamer_points, np.float32))
+                       for camera_points, beamer_points in zip(codes_polygons_points, beamer_codes_polygons_points)
+                       if camera_points is not None and beamer_points is not None]
+        if len(found_codes) < MIN_CODES_NUMBER:
+            return None
+
+        # Estimate the homography from the code centroids, it is used to match the points of the codes
+        camera_centroids = np.array([camera_points.mean(axis=0) for camera_points, _ in found_codes], np.float32)
+        beamer_centroids = np.array([beamer_points.mean(axis=0) for _, beamer_points in found_codes], np.float32)
+        if len(found_codes) == len(QR_CODE_NAMES):
+            estimated_matrix = cv2.getPerspectiveTransform(beamer_centroids, camera_centroids)
+        else:
+            estimated_matrix = np.vstack((cv2.getAffineTransform(beamer_centroids[:3], camera_centroids[:3]),
+                                          [0, 0, 1]))
+
+        # Match the points of each code, the points of a decoded code are not ordered relative to the code
+        camera_points_list = []
+        beamer_points_list = []
+        for camera_points, beamer_points in found_codes:
+            matched_beamer_points = self.match_points(camera_points, beamer_points, estimated_matrix)
+            if matched_beamer_points is not None:
+                camera_points_list.append(camera_points)
+                beamer_points_list.append(matched_beamer_points)
+
+        if not camera_points_list:
+            return None
+
+        # Refine the code points in the gray image
+        camera_points = np.concatenate(camera_points_list).reshape(-1, 1, 2)
+        camera_points = cv2.cornerSubPix(gray_image, camera_points, SUBPIX_WINDOW_SIZE, SUBPIX_ZERO_ZONE,
+                                         SUBPIX_CRITERIA)
+        beamer_points = np.concatenate(beamer_points_list).reshape(-1, 1, 2)
+
+        # Fit one homography which is robust against single wrongly decoded points
+        matrix, inliers = cv2.findHomography(beamer_points, camera_points, cv2.RANSAC, RANSAC_REPROJECTION_THRESHOLD)
+        if matrix is None or np.count_nonzero(inliers) < MIN_INLIERS_NUMBER:
+            logger.debug("could not fit the board homography to {} points".format(len(camera_points)))
+            return None
+
+        logger.debug("fitted the board homography to {} codes ({} of {} points are inliers)".format(
+            len(found_codes), np.count_nonzero(inliers), len(camera_points)))
+
+        return matrix
+
+    # Return the board corners, which are the corners of the beamer image mapped to the camera frame
+    def compute_board_corners(self, matrix):
+
+        beamer_width, beamer_height = self.get_beamer_size()
+        beamer_corners = np.array([[[0, 0]], [[beamer_width, 0]], [[beamer_width, beamer_height]],
+                                   [[0, beamer_height]]], np.float32)
+        corners = cv2.perspectiveTransform(beamer_corners, matrix).reshape(-1, 2)
+
+        return [[float(x), float(y)] for x, y in corners]
+
+    # Return the homography of the beamer image to the camera frame which maps the beamer corners to the board corners
+    def compute_board_homography(self, corners):
+
+        beamer_width, beamer_height = self.get_beamer_size()
+        beamer_corners = np.array([[0, 0], [beamer_width, 0], [beamer_width, beamer_height], [0, beamer_height]],
+                                  np.float32)
 
-        # Continue if all needed data is available
-        if self.found_codes_number == 4:
-            # Iterate through the array with four sets of points for polygons
-            for points_idx in range(len(self.all_codes_polygons_points)):
+        return cv2.getPerspectiveTransform(beamer_corners, np.array(corners, np.float32))
 
-                # Compute the centroid (middle) of the single code
-                code_polygon = geometry.Polygon([[point.x, point.y]
-                                                 for point in self.all_codes_polygons_points[points_idx]])
-                code_centroid = int(code_polygon.centroid.x), int(code_polygon.centroid.y)
-                logger.debug("QR-code centroid found: {}".format(code_centroid))
+    # Set the board corners, the board size and the rectification matrix
+    # from the homography of the beamer image to the camera frame
+    def set_board_homography(self, matrix):
 
-                # Compute the distance between the centroid and the first of corners
-                centroid_corner_distance = BoardDetector.calculate_distance \
-                    (self.all_codes_polygons_points[points_idx][0].x,
-                     self.all_codes_polygons_points[points_idx][0].y,
-                     code_polygon.centroid.x, code_polygon.centroid.y)
+        self.board.corners = self.compute_board_corners(matrix)
+        self.compute_board_size(self.board.corners)
 
-                # Save all centroids in an array -> [top left, top right, bottom right, bottom left]
-                centroids.append(code_centroid)
+        # Map the camera frame to the board, which is the beamer image scaled to the board size
+        beamer_width, beamer_height = self.get_beamer_size()
+        scale = np.diag([self.board.width / beamer_width, self.board.height / beamer_height, 1])
+        self.board.matrix = scale @ np.linalg.inv(matrix)
 
-            # Compute corners position
-            if centroid_corner_distance is not None:
+    # Order the beamer points of a code like the camera points of it
+    # the beamer points are mapped to the camera frame with the estimated homography and
+    # the order with the smallest distance to the camera points is chosen
+    # returns None if the points of the code cannot be matched
+    @staticmethod
+    def match_points(camera_points, beamer_points, estimated_matrix):
+
+        if len(camera_points) != len(beamer_points):
+            return None
+
+        estimated_points = cv2.perspectiveTransform(beamer_points.reshape(-1, 1, 2), estimated_matrix).reshape(-1, 2)
+        best_order = min(permutations(range(len(beamer_points))),
+                         key=lambda order: np.linalg.norm(camera_points - estimated_points[list(order)], axis=1).sum())
+
+        return beamer_points[list(best_order)]
+
+    # Return the beamer resolution
+    def get_beamer_size(self):
+        return int(self.config.get("beamer_resolution", "width")), int(self.config.get("beamer_resolution", "height"))
+
+    # Decode the QR-codes as they are drawn on the beamer image and return their polygons
+    # in the order of QR_CODE_NAMES (None for codes which could not be decoded)
+    def get_beamer_codes_polygons_points(self):
 
-                # Compute position of the top right and bottom left board corners
-                top_left_corner, bottom_right_corner = \
-                    self.set_corners(self.all_codes_polygons_points[0],
-                                     centroids[0], centroids[2], int(centroid_corner_distance))
+        if self.beamer_codes_polygons_points is None:
 
-                logger.debug("TL corner: {}, BR corner: {}".format(top_left_corner, bottom_right_corner))
+            beamer_width, beamer_height = self.get_beamer_size()
+            qr_size = self.config.get("qr_code", "size")
+            image_handler = ImageHandler(self.config)
 
-                # Compute position of the top left and bottom right board corners
-                top_right_corner, bottom_left_corner = \
-                    self.set_corners(self.all_codes_polygons_points[1],
-                                     centroids[1], centroids[3], int(centroid_corner_distance))
+            # Draw the codes on a white frame in the beamer corners
+            beamer_image = np.ones((beamer_height, beamer_width, 4), np.uint8) * MAX_VALUE
+            positions = [(0, 0), (beamer_width - qr_size, 0), (beamer_width - qr_size, beamer_height - qr_size),
+                         (0, beamer_height - qr_size)]
+            for resource, position in zip(QR_CODE_RESOURCES, positions):
+                ImageHandler.img_on_background(beamer_image, image_handler.load_image(resource, (qr_size, qr_size)),
+                                               position)
 
-                logger.debug("TR corner: {}, BL corner: {}".format(top_right_corner, bottom_left_corner))
+            beamer_codes_polygons_points = [None, None, None, None]
+            for code in pyzbar.decode(cv2.cvtColor(beamer_image, cv2.COLOR_BGRA2GRAY)):
+                code_data = code.data.decode()
+                for code_idx, code_name in enumerate(QR_CODE_NAMES):
+                    if code_name in code_data:
+                        beamer_codes_polygons_points[code_idx] = code.polygon
 
-        # If all corners are found, save them in the right order
-        if top_left_corner is not None and top_right_corner is not None and \
-                bottom_right_corner is not None and bottom_left_corner is not None:
+            if all(polygon is None for polygon in beamer_codes_polygons_points):
+                logger.error("could not decode the QR-codes of the beamer image")
+                return None
 
-            self.board.corners = [top_left_corner, top_right_corner, bottom_right_corner, bottom_left_corner]
-            self.compute_board_size(self.board.corners)
-            logger.info("all board corners found: {}".format(self.board.corners))
-            all_board_corners_found = True
+            self.beamer_codes_polygons_points = beamer_codes_polygons_points
 
-        return all_board_corners_found
+        return self.beamer_codes_polygons_points
 
     # Find min and max for x and y position of the board
     @staticmethod
@@ -280,8 +418,9 @@ class BoardDetector:
             # y.append(corner[0])
         return min(x), min(y), max(x), max(y)
 
-    # Wrap the frame perspective to a top-down view (rectangle)
-    def rectify(self, image, corners):
+    # Compute the fixed-point remap tables which warp the frame perspective to a top-down view (rectangle)
+    # they are only computed again if the corners or the board size changed
+    def get_rectification_maps(self, corners):
 
         # Save given corners in a numpy array
         source_corners = np.zeros((4, 2), dtype="float32")
@@ -290,30 +429,82 @@ class BoardDetector:
         source_corners[2] = corners[2]
         source_corners[3] = corners[3]
 
-        # Construct destination points which will be used to map the board to a top-down view
-        destination_corners = np.array([
-            [0, 0],
-            [self.board.width - 1, 0],
-            [self.board.width - 1, self.board.height - 1],
-            [0, self.board.height - 1]], dtype="float32")
+        board_width = int(self.board.width)
+        board_height = int(self.board.height)
+
+        # Use the matrix of the board calibration if available
+        if self.board.matrix is not None:
+            rectification_key = (self.board.matrix.tobytes(), board_width, board_height)
+        else:
+            rectification_key = (source_corners.tobytes(), board_width, board_height)
+
+        if rectification_key != self.rectification_key:
+
+            if self.board.matrix is not None:
+                matrix = self.board.matrix
 
-        # Calculate the perspective transform matrix
-        matrix = cv2.getPerspectiveTransform(source_corners, destination_corners)
-        rectified_image = cv2.warpPerspective(image, matrix, (self.board.width, self.board.height))
+            else:
+                # Construct destination points which will be used to map the board to a top-down view
+                destination_corners = np.array([
+                    [0, 0],
+                    [board_width - 1, 0],
+                    [board_width - 1, board_height - 1],
+                    [0, board_height - 1]], dtype="float32")
+
+                # Calculate the perspective transform matrix
+                matrix = cv2.getPerspectiveTransform(source_corners, destination_corners)
+
+            # Map every pixel of the board back to its position in the frame
+            grid_x, grid_y = np.meshgrid(np.arange(board_width, dtype=np.float32),
+                                         np.arange(board_height, dtype=np.float32))
+            destination_points = np.dstack((grid_x, grid_y))
+            source_points = cv2.perspectiveTransform(destination_points, np.linalg.inv(matrix))
+
+            # Convert the maps to fixed-point, which makes cv2.remap faster
+            self.rectification_maps = cv2.convertMaps(source_points[:, :, 0], source_points[:, :, 1], cv2.CV_16SC2)
+            self.rectification_key = rectification_key
+            logger.info("computed rectification maps for corners {}".format(source_corners.tolist()))
+
+        return self.rectification_maps
+
+    # Wrap the frame perspective to a top-down view (rectangle)
+    # the rectified image is written into the output buffer if one with the board size is given
+    def rectify(self, image, corners, interpolation=cv2.INTER_LINEAR, output=None):
+
+        map_xy, map_interpolation = self.get_rectification_maps(corners)
+        rectified_image = cv2.remap(image, map_xy, map_interpolation, interpolation, dst=output)
 
         return rectified_image
 
+    # Return the buffer if it fits the board size and the image type, otherwise a new one
+    def get_buffer(self, buffer, image):
+
+        shape = (int(self.board.height), int(self.board.width)) + image.shape[2:]
+        if buffer is None or buffer.shape != shape or buffer.dtype != image.dtype:
+            buffer = np.zeros(shape, image.dtype)
+
+        return buffer
+
     # Compute board size and set in configs
     def compute_board_size(self, corners):
 
-        min_x, min_y, max_x, max_y = self.find_min_max(corners)
+        top_left, top_right, bottom_right, bottom_left = corners
+
+        # Compute board size as the average length of the opposite board edges
+        width = (self.calculate_distance(*top_left, *top_right)
+                 + self.calculate_distance(*bottom_left, *bottom_right)) / 2
+        height = (self.calculate_distance(*top_left, *bottom_left)
+                  + self.calculate_distance(*top_right, *bottom_right)) / 2
+        self.set_board_size(int(round(width)), int(round(height)))
+
+    # Set the board size and the board extent
+    def set_board_size(self, width, height):
 
-        # Compute board size
-        self.board.width = max_x - min_x
-        self.board.height = max_y - min_y
+        self.board.width = width
+        self.board.height = height
 
-        ExtentTracker.get_instance().board = Extent.from_rectangle(0, 0, self.board.width, self.board.height)
-        logger.info('board has been set to {}'.format(ExtentTracker.get_instance().board))
+        self.context.extent_tracker.board = Extent.from_rectangle(0, 0, self.board.width, self.board.height)
+        logger.info('board has been set to {}'.format(self.context.extent_tracker.board))
 
     # Display QR-codes location
     @staticmethod
@@ -338,20 +529,40 @@ class BoardDetector:
                 cv2.line(frame, hull[j], hull[(j + 1) % n], (0, 255, 0), 3)
 
     # Compute region of interest (board area) from the color image
-    def rectify_image(self, region_of_interest, color_image):
+    # the region of interest is written into a preallocated buffer,
+    # which keeps the last board area if the corners are not within the frame
+    def rectify_image(self, color_image):
+
+        self.rectified_image = self.get_buffer(self.rectified_image, color_image)
 
         # Check if found QR-code markers positions are included in the frame size
         if all([0, 0] < corners < [color_image.shape[1], color_image.shape[0]]
                for corners in self.board.corners):
 
             # Eliminate perspective transformations and show only the board
-            rectified_image = self.rectify(color_image, self.board.corners)
-            region_of_interest[0:self.board.height, 0:self.board.width] = rectified_image
+            self.rectify(color_image, self.board.corners, output=self.rectified_image)
+
+        return self.rectified_image
+
+    # Compute the board area from the depth image (aligned to the color image)
+    # returns None if the board corners are not within the frame
+    def rectify_depth(self, depth_image):
+
+        # Take only one channel of a stacked depth image
+        if depth_image.ndim == 3:
+            depth_image = np.ascontiguousarray(depth_image[:, :, 0])
+
+        if all([0, 0] < corners < [depth_image.shape[1], depth_image.shape[0]]
+               for corners in self.board.corners):
 
-        # return the clipped board
-        return region_of_interest[0:self.board.height, 0:self.board.width]
+            # Do not interpolate between depth values of the board and of objects on it
+            self.rectified_depth = self.get_buffer(self.rectified_depth, depth_image)
+            return self.rectify(depth_image, self.board.corners, cv2.INTER_NEAREST, self.rectified_depth)
 
-    # saves the average image over a certain time period returns true if enough iterations were done
+        return None
+
+    # saves the average image until it does not change anymore, returns true if it is stable
+    # or the maximum number of iterations was reached
     # FIXME: as the background currently is only used for qr-code detection we might try it without it
     # FIXME: or integrate the qr-code check in the iterative background generation
     def compute_background(self, color_image):
@@ -359,19 +570,35 @@ class BoardDetector:
         # Save background
         if self.current_loop == 0:
             self.background = color_image.copy().astype("float")
-            self.last_color_image = self.background
-
-        if self.current_loop < MAX_LOOP_NUMBER:
-            # Update a running average
-            cv2.accumulateWeighted(color_image, self.background, INPUT_WEIGHT)
+            self.last_small_background = self.downscale_background()
+            self.background_start_time = time.perf_counter()
             self.current_loop += 1
+            return False
+
+        # Update a running average
+        cv2.accumulateWeighted(color_image, self.background, INPUT_WEIGHT)
+        self.current_loop += 1
+
+        # Measure how much the running average changed with this frame
+        small_background = self.downscale_background()
+        change = float(np.mean(np.abs(small_background - self.last_small_background)))
+        self.last_small_background = small_background
+        logger.debug("white balance changed by {:.2f} in iteration {}".format(change, self.current_loop))
+
+        # finish white balance if no more change from the average can be detected
+        if change <= self.background_tolerance and self.current_loop >= MIN_LOOP_NUMBER:
+            logger.info("found a stable white balance after {} frames in {:.2f} s".format(
+                self.current_loop, time.perf_counter() - self.background_start_time))
+            return True
 
-            # finish white balance if no more change from the average can be detected
-            if (self.last_color_image.all() == self.background.all()) and (self.current_loop > MIN_LOOP_NUMBER):
-                logger.info("found a stable white balance after {} iterations".format(self.current_loop))
-                return True
-        else:
-            logger.info("white balance reached maximum number of iterations ({})".format(MAX_LOOP_NUMBER))
+        if self.current_loop >= MAX_LOOP_NUMBER:
+            logger.info("white balance reached maximum number of iterations ({}) in {:.2f} s (change {:.2f})".format(
+                MAX_LOOP_NUMBER, time.perf_counter() - self.background_start_time, change))
             return True
 
         return False
+
+    # return a downscaled copy of the running average
+    def downscale_background(self):
+        return cv2.resize(self.background, None, fx=CONVERGENCE_SCALE, fy=CONVERGENCE_SCALE,
+                          interpolation=cv2.INTER_AREA)
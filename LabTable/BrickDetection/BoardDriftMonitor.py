@@ -0,0 +1,232 @@
+import logging
+import math
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from LabTable.BrickDetection.BoardDetector import BoardDetector
+from LabTable.BrickDetection.CalibrationCache import CalibrationCache
+from LabTable.BrickDetection.ShapeDetector import ShapeDetector
+
+# enable logger
+logger = logging.getLogger(__name__)
+
+# Side length in full resolution pixels of the reference patches around the board corners
+PATCH_SIZE = 64
+
+# Distance in full resolution pixels around the last board corners in which the patches are searched
+SEARCH_DISTANCE = 32
+
+# Minimum normalized correlation of a patch with the frame to count as found
+MIN_MATCH_SCORE = 0.8
+
+# Minimum standard deviation (gray values) of a reference patch, flat patches cannot be located
+MIN_PATCH_CONTRAST = 5.0
+
+
+# this class re-checks the board calibration in a background thread while bricks are detected
+# the first frame handed to the thread after the calibration is the reference: the image patches around
+# the board corners are stored and searched again on a decimated copy of a frame every few seconds,
+# if the board corners drifted (e.g. someone bumped the table) the board homography is fitted to the found corners
+# the new homography is applied by the main thread before the next frame is rectified and stored in the calibration
+# NOTE: the board corners should show some stable structure (e.g. the border of the board),
+# a check is skipped if a patch is not found (e.g. covered by a hand or a changed projection)
+class BoardDriftMonitor:
+
+    def __init__(self, config, board_detector: BoardDetector, calibration_cache: CalibrationCache,
+                 shape_detector: ShapeDetector):
+
+        self.board_detector = board_detector
+        self.calibration_cache = calibration_cache
+        self.shape_detector = shape_detector
+
+        # seconds between two checks, scale of the decimated frame and the
+        # minimum corner movement in pixels which counts as drift
+        self.interval = config.get("board_drift", "interval")
+        self.scale = config.get("board_drift", "scale")
+        self.threshold = config.get("board_drift", "threshold")
+
+        # the frame and the board corners handed to the thread and the homography found by it,
+        # all guarded by the lock
+        self.lock = threading.Lock()
+        self.gray_image = None
+        self.corners = None
+        self.pending_matrix = None
+        self.frame_ready = threading.Event()
+        self.last_check_time = time.monotonic()
+
+        # the patches of the decimated reference frame with the position of the board corner in them,
+        # only used by the thread
+        self.references = None
+
+        # time spent in the main thread for applying the last drift and by the thread for the last check
+        self.apply_duration = 0.0
+        self.check_duration = 0.0
+        self.checks_number = 0
+        self.drifts_number = 0
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="BoardDriftMonitor", daemon=True)
+        self.thread.start()
+
+    # hand the frame to the thread if the interval elapsed and the thread is idle
+    def submit(self, color_image):
+
+        now = time.monotonic()
+        if now - self.last_check_time >= self.interval and not self.frame_ready.is_set():
+            self.last_check_time = now
+            with self.lock:
+                self.gray_image = cv2.cvtColor(color_image, cv2.COLOR_BGR2GRAY)
+                self.corners = [list(corner) for corner in self.board_detector.board.corners]
+            self.frame_ready.set()
+
+    # apply a homography found by the thread and store the calibration, returns true if the board calibration changed
+    # the rectification maps are computed again right away, so that their cost is part of the apply duration
+    def apply_drift(self) -> bool:
+
+        with self.lock:
+            matrix = self.pending_matrix
+            self.pending_matrix = None
+
+        if matrix is None:
+            return False
+
+        start = time.perf_counter()
+
+        self.board_detector.set_board_homography(matrix)
+        self.board_detector.get_rectification_maps(self.board_detector.board.corners)
+        self.calibration_cache.save(self.board_detector, self.shape_detector)
+
+        self.apply_duration = time.perf_counter() - start
+        logger.info("board drifted, new board corners: {} (applied in {:.1f} ms)".format(
+            self.board_detector.board.corners, self.apply_duration * 1000))
+
+        return True
+
+    # check the frames handed to the thread until it is stopped
+    def run(self):
+
+        while self.running:
+
+            if not self.frame_ready.wait(timeout=self.interval) or not self.running:
+                continue
+
+            with self.lock:
+                gray_image = self.gray_image
+                corners = self.corners
+
+            start = time.perf_counter()
+            matrix = self.check(gray_image, corners)
+            self.check_duration = time.perf_counter() - start
+            self.checks_number += 1
+
+            if matrix is not None:
+                with self.lock:
+                    self.pending_matrix = matrix
+
+            self.frame_ready.clear()
+
+    # search the reference patches around the board corners on a decimated copy of the gray image
+    # and fit the board homography to the found corners, the first checked image is taken as the reference
+    # returns the homography if the board corners moved more than the threshold, otherwise None
+    def check(self, gray_image, corners):
+
+        small_image = cv2.resize(gray_image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+        if self.references is None:
+            self.references = [self.get_reference(small_image, corner) for corner in corners]
+            logger.info("board drift references taken for {} of {} corners".format(
+                sum(reference is not None for reference in self.references), len(corners)))
+            return None
+
+        # all corners are needed to fit the homography
+        found_corners = []
+        for corner, reference in zip(corners, self.references):
+            found_corner = None if reference is None else self.find_corner(small_image, corner, reference)
+            if found_corner is None:
+                logger.debug("board drift check could not find the board corner near {}".format(corner))
+                return None
+            found_corners.append(found_corner)
+
+        # compare the found corners with the current ones
+        drift = float(np.linalg.norm(np.array(found_corners) - np.array(corners), axis=1).max())
+        logger.debug("board drift check: corners moved by {:.1f} px".format(drift))
+
+        if drift <= self.threshold:
+            return None
+
+        self.drifts_number += 1
+        return self.board_detector.compute_board_homography(found_corners)
+
+    # return the patch of the decimated image around the board corner together with the position
+    # of the corner in the patch, None if the patch lies mostly outside the image or is too flat
+    def get_reference(self, small_image, corner):
+
+        half_size = PATCH_SIZE * self.scale / 2
+        corner_x, corner_y = corner[0] * self.scale, corner[1] * self.scale
+        start_x, start_y = max(0, int(round(corner_x - half_size))), max(0, int(round(corner_y - half_size)))
+        end_x = min(small_image.shape[1], int(round(corner_x + half_size)))
+        end_y = min(small_image.shape[0], int(round(corner_y + half_size)))
+
+        if end_x - start_x < half_size or end_y - start_y < half_size:
+            return None
+
+        patch = small_image[start_y:end_y, start_x:end_x].copy()
+        if patch.std() < MIN_PATCH_CONTRAST:
+            return None
+
+        return patch, (corner_x - start_x, corner_y - start_y)
+
+    # search the reference patch around the last position of the board corner in the decimated image
+    # returns the found board corner in full resolution coordinates or None if the patch was not found
+    def find_corner(self, small_image, corner, reference):
+
+        patch, (offset_x, offset_y) = reference
+        patch_height, patch_width = patch.shape
+        search_distance = SEARCH_DISTANCE * self.scale
+
+        # the window in which the patch is searched around its expected position
+        expected_x = corner[0] * self.scale - offset_x
+        expected_y = corner[1] * self.scale - offset_y
+        start_x = max(0, int(math.floor(expected_x - search_distance)))
+        start_y = max(0, int(math.floor(expected_y - search_distance)))
+        end_x = min(small_image.shape[1], int(math.ceil(expected_x + patch_width + search_distance)))
+        end_y = min(small_image.shape[0], int(math.ceil(expected_y + patch_height + search_distance)))
+
+        if end_x - start_x < patch_width or end_y - start_y < patch_height:
+            return None
+
+        scores = cv2.matchTemplate(small_image[start_y:end_y, start_x:end_x], patch, cv2.TM_CCOEFF_NORMED)
+        _, max_score, _, (match_x, match_y) = cv2.minMaxLoc(scores)
+        if max_score < MIN_MATCH_SCORE:
+            return None
+
+        # refine the match between the pixels with a parabola through the neighbouring scores
+        refined_x = match_x + self.get_parabola_peak(scores[match_y, :], match_x)
+        refined_y = match_y + self.get_parabola_peak(scores[:, match_x], match_y)
+
+        return [(start_x + refined_x + offset_x) / self.scale, (start_y + refined_y + offset_y) / self.scale]
+
+    # return the offset of the peak of a parabola through the score at the index and its neighbours
+    # (0 if the index has no neighbours or they do not form a peak)
+    @staticmethod
+    def get_parabola_peak(scores, index):
+
+        if index <= 0 or index >= len(scores) - 1:
+            return 0.0
+
+        previous_score, score, next_score = scores[index - 1:index + 2]
+        curvature = previous_score - 2 * score + next_score
+        if curvature >= 0:
+            return 0.0
+
+        return float(0.5 * (previous_score - next_score) / curvature)
+
+    # stop the thread
+    def close(self):
+
+        self.running = False
+        self.frame_ready.set()
+        self.thread.join()
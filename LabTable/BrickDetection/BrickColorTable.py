@@ -0,0 +1,70 @@
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from LabTable.Model.Brick import BrickColor
+
+# enable logger
+logger = logging.getLogger(__name__)
+
+# OpenCV supports:
+# H-value range (0 to 180)
+# S-value range (0 to 255)
+# V-value range (0 to 255)
+HUE_LEVELS = 181
+SATURATION_LEVELS = 256
+VALUE_LEVELS = 256
+
+# Color channels
+HUE = 0
+SATURATION = 1
+VALUE = 2
+
+
+# this class compiles the configured brick_colors into a dense lookup table
+# which maps every hsv value to the BrickColor value it belongs to
+# (BrickColor.UNKNOWN_COLOR if it does not lie in any configured range)
+class BrickColorTable:
+
+    def __init__(self, config):
+
+        self.config = config
+
+        # the configured colors in the order of the configuration
+        self.colors: List[BrickColor] = []
+        self.lookup_table = None
+
+        # the configured lower and upper hsv bounds of each color
+        self.color_ranges: Dict[BrickColor, List[Tuple[np.ndarray, np.ndarray]]] = {}
+
+        self.compile()
+
+        # rebuild the lookup table as soon as the configuration is reloaded
+        config.add_refresh_callback(self.compile)
+
+    # compile the brick_colors configuration into the lookup table
+    def compile(self):
+
+        brick_colors = self.config.get("brick_colors")
+        lookup_table = np.full((HUE_LEVELS, SATURATION_LEVELS, VALUE_LEVELS), BrickColor.UNKNOWN_COLOR.value, np.uint8)
+
+        # the first configured range containing a value wins,
+        # so fill the table in reversed order and let earlier ranges overwrite later ones
+        for color_name, color_ranges in reversed(list(brick_colors.items())):
+            color = BrickColor[color_name]
+            for lower, upper in reversed(color_ranges):
+                lookup_table[lower[HUE]:upper[HUE] + 1,
+                             lower[SATURATION]:upper[SATURATION] + 1,
+                             lower[VALUE]:upper[VALUE] + 1] = color.value
+
+        self.colors = [BrickColor[color_name] for color_name in brick_colors]
+        self.color_ranges = {BrickColor[color_name]: [(np.array(lower, np.uint8), np.array(upper, np.uint8))
+                                                      for lower, upper in color_ranges]
+                             for color_name, color_ranges in brick_colors.items()}
+        self.lookup_table = lookup_table
+        logger.info("compiled brick color lookup table for {}".format([color.name for color in self.colors]))
+
+    # return the BrickColor values for an image in hsv
+    def classify(self, hsv_image):
+        return self.lookup_table[hsv_image[..., HUE], hsv_image[..., SATURATION], hsv_image[..., VALUE]]
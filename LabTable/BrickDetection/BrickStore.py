@@ -0,0 +1,128 @@
+import logging
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, ValuesView
+
+from LabTable.Model.Brick import Brick, BrickStatus
+from LabTable.BrickDetection.SpatialGrid import SpatialGrid
+
+# enable logger
+logger = logging.getLogger(__name__)
+
+
+# this class holds bricks indexed by their object id, their status and their position,
+# so that adding, removing, finding and filtering bricks does not scan all bricks
+# the bricks are keyed by their identity, as the equality of bricks depends on their centroid
+# NOTE: the status and object id of a stored brick have to be changed with set_status and set_object_id
+# and the positions have to be indexed again with move or reindex_positions after centroids changed
+class BrickStore:
+
+    def __init__(self, cell_size):
+
+        self.bricks: Dict[int, Brick] = {}
+        self.bricks_by_object_id: Dict[int, Dict[int, Brick]] = {}
+        self.bricks_by_status: Dict[BrickStatus, Dict[int, Brick]] = {status: {} for status in BrickStatus}
+        self.grid = SpatialGrid(cell_size)
+
+    # add a brick if it is not stored yet
+    def add(self, brick: Brick):
+
+        key = id(brick)
+        if key in self.bricks:
+            return
+
+        self.bricks[key] = brick
+        self.bricks_by_status[brick.status][key] = brick
+        if brick.object_id is not None:
+            self.bricks_by_object_id.setdefault(brick.object_id, {})[key] = brick
+        self.grid.add(brick)
+
+    # remove a stored brick
+    def remove(self, brick: Brick):
+
+        key = id(brick)
+        if self.bricks.pop(key, None) is None:
+            logger.warning("could not remove {} from the store".format(brick))
+            return
+
+        del self.bricks_by_status[brick.status][key]
+        self.remove_object_id(brick)
+        self.grid.remove(brick)
+
+    # remove the brick from the object id index
+    def remove_object_id(self, brick: Brick):
+
+        object_bricks = self.bricks_by_object_id.get(brick.object_id)
+        if object_bricks is not None:
+            object_bricks.pop(id(brick), None)
+            if not object_bricks:
+                del self.bricks_by_object_id[brick.object_id]
+
+    # change the status of a (stored) brick
+    def set_status(self, brick: Brick, status: BrickStatus):
+
+        key = id(brick)
+        if key in self.bricks:
+            del self.bricks_by_status[brick.status][key]
+            self.bricks_by_status[status][key] = brick
+
+        brick.status = status
+
+    # change the object id of a (stored) brick
+    def set_object_id(self, brick: Brick, object_id):
+
+        key = id(brick)
+        if key in self.bricks:
+            self.remove_object_id(brick)
+            if object_id is not None:
+                self.bricks_by_object_id.setdefault(object_id, {})[key] = brick
+
+        brick.object_id = object_id
+
+    # index a stored brick again after its centroid moved from the old position
+    def move(self, brick: Brick, old_x, old_y):
+
+        if brick in self:
+            self.grid.move(brick, old_x, old_y)
+
+    # index all bricks at their current centroids again
+    def reindex_positions(self):
+        self.grid.rebuild(self.bricks.values())
+
+    # drop all bricks
+    def clear(self):
+
+        self.bricks.clear()
+        self.bricks_by_object_id.clear()
+        for status_bricks in self.bricks_by_status.values():
+            status_bricks.clear()
+        self.grid.clear()
+
+    # return all bricks with the given object id
+    def get_by_object_id(self, object_id) -> List[Brick]:
+        return list(self.bricks_by_object_id.get(object_id, {}).values())
+
+    # return a read-only view of the bricks with the given status
+    def get_by_status(self, status: BrickStatus) -> ValuesView[Brick]:
+        return self.bricks_by_status[status].values()
+
+    # iterate over the bricks with any other status than the given one
+    def get_except_status(self, status: BrickStatus) -> Iterator[Brick]:
+        return chain.from_iterable(status_bricks.values() for other_status, status_bricks
+                                   in self.bricks_by_status.items() if other_status != status)
+
+    # return a read-only view of all bricks
+    def view(self) -> ValuesView[Brick]:
+        return self.bricks.values()
+
+    # return the closest brick within max_distance in both dimensions of the given brick or None
+    def find_neighbour(self, brick: Brick, max_distance) -> Optional[Brick]:
+        return self.grid.find_neighbour(brick, max_distance)
+
+    def __contains__(self, brick: Brick):
+        return id(brick) in self.bricks
+
+    def __iter__(self) -> Iterator[Brick]:
+        return iter(self.bricks.values())
+
+    def __len__(self):
+        return len(self.bricks)
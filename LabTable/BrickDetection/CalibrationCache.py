@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+
+import cv2
+import numpy as np
+
+from LabTable.BrickDetection.BoardDetector import BoardDetector
+from LabTable.BrickDetection.ShapeDetector import ShapeDetector
+from LabTable.TableContext import TableContext
+
+# enable logger
+logger = logging.getLogger(__name__)
+
+# Scale of the downscaled grayscale images which are compared to verify a stored calibration
+VERIFICATION_SCALE = 0.25
+
+# Width in pixels of the strips along the board sides which are compared to verify the stored board corners
+BORDER_STRIP_WIDTH = 8
+
+# Maximum value of a mask
+MAX_VALUE = 255
+
+# The ShapeDetector attributes derived from the distance to the board
+BRICK_DIMENSIONS = ["min_square_length", "max_square_length", "min_rectangle_length", "max_rectangle_length",
+                    "min_square_area", "max_square_area", "min_rectangle_area", "max_rectangle_area"]
+
+
+# this class stores the results of the calibration stages (WHITE_BALANCE and FIND_CORNERS) in a file
+# for each camera and resolution, so that a restarted program can skip them as long as the camera
+# still sees the same board
+class CalibrationCache:
+
+    def __init__(self, config, context: TableContext):
+
+        self.directory = config.get("calibration", "directory")
+        self.tolerance = config.get("calibration", "tolerance")
+
+        # the calibration is keyed by the camera implementation and the resolution (and the name of the table)
+        self.key = "{}_{}x{}".format(config.get("camera", "implementation"),
+                                     config.get("video_resolution", "width"),
+                                     config.get("video_resolution", "height"))
+        if context.name:
+            self.key = "{}_{}".format(context.name, self.key)
+
+        self.calibration_path = os.path.join(self.directory, "calibration_{}.json".format(self.key))
+        self.background_path = os.path.join(self.directory, "background_{}.png".format(self.key))
+
+        # the stored calibration, it is read only once
+        self.loaded = False
+        self.calibration = None
+        self.background = None
+
+    # store the current calibration of the board and the derived brick dimensions
+    def save(self, board_detector: BoardDetector, shape_detector: ShapeDetector):
+
+        board = board_detector.board
+        calibration = {
+            "corners": [[float(value) for value in corner] for corner in board.corners],
+            "width": int(board.width),
+            "height": int(board.height),
+            "distance": None if board.distance is None else float(board.distance),
+            "matrix": None if board.matrix is None else board.matrix.tolist(),
+            "brick_dimensions": {name: float(getattr(shape_detector, name)) for name in BRICK_DIMENSIONS}
+        }
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            cv2.imwrite(self.background_path, board_detector.background.astype(np.uint8))
+            with open(self.calibration_path, "w") as calibration_file:
+                json.dump(calibration, calibration_file, indent=2)
+            logger.info("saved calibration to {}".format(self.calibration_path))
+
+        except (OSError, cv2.error) as e:
+            logger.warning("could not save calibration to {}: {}".format(self.calibration_path, e))
+
+    # read the stored calibration and background of this camera and resolution
+    def load(self):
+
+        self.loaded = True
+
+        if not os.path.isfile(self.calibration_path):
+            logger.info("no stored calibration found for {}".format(self.key))
+            return
+
+        try:
+            with open(self.calibration_path) as calibration_file:
+                self.calibration = json.load(calibration_file)
+            self.background = cv2.imread(self.background_path)
+
+        except (OSError, ValueError) as e:
+            logger.warning("could not read the stored calibration {}: {}".format(self.calibration_path, e))
+            self.calibration = None
+
+    # restore the stored calibration if the color image still shows the stored background
+    # returns true if the calibration was restored
+    def restore(self, color_image, board_detector: BoardDetector, shape_detector: ShapeDetector) -> bool:
+
+        if not self.loaded:
+            self.load()
+
+        calibration, background = self.calibration, self.background
+        if calibration is None or background is None or background.shape != color_image.shape:
+            return False
+
+        # compare the current image with the stored background,
+        # a moved camera or board changes most of the image while some bricks only change small parts
+        difference = self.compute_difference(color_image, background)
+        if difference > self.tolerance:
+            logger.info("stored calibration does not fit (difference {:.1f} > {})".format(
+                difference, self.tolerance))
+            return False
+
+        # compare strips along the stored board sides, as a board which moved by a few pixels
+        # only changes the pixels along its border and hardly changes the difference of the whole image
+        border_difference = self.compute_border_difference(color_image, background, calibration["corners"])
+        if border_difference > self.tolerance:
+            logger.info("stored board corners do not fit (border difference {:.1f} > {})".format(
+                border_difference, self.tolerance))
+            return False
+
+        board = board_detector.board
+        board.corners = [list(corner) for corner in calibration["corners"]]
+        board.distance = calibration["distance"]
+        board.matrix = None if calibration.get("matrix") is None else np.array(calibration["matrix"])
+        board_detector.set_board_size(calibration["width"], calibration["height"])
+        board_detector.background = background.astype("float")
+
+        for name, value in calibration["brick_dimensions"].items():
+            setattr(shape_detector, name, value)
+
+        logger.info("restored calibration from {} (difference {:.1f})".format(self.calibration_path, difference))
+        return True
+
+    # return the mean absolute difference between two color images on downscaled grayscale copies
+    @staticmethod
+    def compute_difference(color_image, other_color_image) -> float:
+
+        gray = cv2.cvtColor(color_image, cv2.COLOR_BGR2GRAY)
+        other_gray = cv2.cvtColor(other_color_image, cv2.COLOR_BGR2GRAY)
+
+        gray = cv2.resize(gray, None, fx=VERIFICATION_SCALE, fy=VERIFICATION_SCALE, interpolation=cv2.INTER_AREA)
+        other_gray = cv2.resize(other_gray, None, fx=VERIFICATION_SCALE, fy=VERIFICATION_SCALE,
+                                interpolation=cv2.INTER_AREA)
+
+        return float(cv2.absdiff(gray, other_gray).mean())
+
+    # return the largest mean absolute difference between two color images within the strips along the board sides
+    @staticmethod
+    def compute_border_difference(color_image, other_color_image, corners) -> float:
+
+        difference = cv2.absdiff(cv2.cvtColor(color_image, cv2.COLOR_BGR2GRAY),
+                                 cv2.cvtColor(other_color_image, cv2.COLOR_BGR2GRAY))
+
+        # compare each side on its own, as a shift along one axis changes only two of the sides
+        side_differences = []
+        for start, end in zip(corners, corners[1:] + corners[:1]):
+            strip_mask = np.zeros(difference.shape, np.uint8)
+            cv2.line(strip_mask, (int(round(start[0])), int(round(start[1]))),
+                     (int(round(end[0])), int(round(end[1]))), MAX_VALUE, BORDER_STRIP_WIDTH)
+            side_differences.append(cv2.mean(difference, strip_mask)[0])
+
+        return float(max(side_differences))
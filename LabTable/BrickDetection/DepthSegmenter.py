@@ -0,0 +1,76 @@
+import logging
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+from numpy import ndarray
+
+from LabTable.Model.Board import Board
+
+# enable logger
+logger = logging.getLogger(__name__)
+
+# Maximum value of a mask
+MAX_VALUE = 255
+
+# Kernel size of the morphological opening which removes depth noise from the mask
+OPENING_KERNEL_SIZE = 3
+
+# Kernel size of the dilation which makes sure that the brick edges lie inside the mask
+DILATION_KERNEL_SIZE = 7
+
+# Padding in pixels around the raised objects
+REGION_PADDING = 4
+
+
+# this class uses the depth stream (aligned to the color stream) to find objects raised above the board
+# only these parts of the region of interest have to be searched for bricks,
+# so that projected imagery, QR-code markers and shadows are skipped
+class DepthSegmenter:
+
+    def __init__(self, config, board: Board):
+
+        self.board = board
+
+        # minimum height above the board in depth units (usually millimeters)
+        self.min_height = config.get("brick_detection", "depth_min_height")
+
+        self.opening_kernel = np.ones((OPENING_KERNEL_SIZE, OPENING_KERNEL_SIZE), np.uint8)
+        self.dilation_kernel = np.ones((DILATION_KERNEL_SIZE, DILATION_KERNEL_SIZE), np.uint8)
+
+    # mask all pixels of the rectified depth image which are raised above the board
+    # returns None if the distance to the board is unknown
+    def find_raised_mask(self, depth_image) -> Optional[ndarray]:
+
+        if not self.board.distance:
+            return None
+
+        # pixels without depth information (0) are not raised
+        max_distance = self.board.distance - self.min_height
+        raised_mask = ((depth_image > 0) & (depth_image < max_distance)).astype(np.uint8) * MAX_VALUE
+
+        # remove depth noise and grow the mask over the brick edges
+        raised_mask = cv2.morphologyEx(raised_mask, cv2.MORPH_OPEN, self.opening_kernel)
+        raised_mask = cv2.dilate(raised_mask, self.dilation_kernel)
+
+        return raised_mask
+
+    # return the padded bounding boxes (x, y, width, height) of all raised objects with at least the given area
+    @staticmethod
+    def find_raised_regions(raised_mask, min_area) -> List[Tuple[int, int, int, int]]:
+
+        height, width = raised_mask.shape
+        regions = []
+
+        regions_number, _, stats, _ = cv2.connectedComponentsWithStats(raised_mask, connectivity=8)
+        for left_x, upper_y, region_width, region_height, area in stats[1:regions_number]:
+            if area >= min_area:
+                start_x = max(0, left_x - REGION_PADDING)
+                start_y = max(0, upper_y - REGION_PADDING)
+                end_x = min(width, left_x + region_width + REGION_PADDING)
+                end_y = min(height, upper_y + region_height + REGION_PADDING)
+                regions.append((int(start_x), int(start_y), int(end_x - start_x), int(end_y - start_y)))
+
+        logger.debug("found {} raised objects".format(len(regions)))
+
+        return regions
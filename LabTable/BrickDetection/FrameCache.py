@@ -0,0 +1,122 @@
+import logging
+import threading
+
+import cv2
+
+# enable logger
+logger = logging.getLogger(__name__)
+
+# Canny edge detection thresholds
+CANNY_THRESHOLD_LOW = 30
+CANNY_THRESHOLD_HIGH = 120
+
+
+# this class holds images derived from the current region of interest frame
+# (hsv, grayscale and edges), so that they are computed only once per frame
+# and shared by all contours of the frame
+class FrameCache:
+
+    def __init__(self):
+
+        self.frame = None
+        self.derived_images = {}
+
+        # optional mask of the frame, edges and color blobs are only searched within it
+        self.mask = None
+
+        # derived images may be requested by several detection workers at once
+        self.lock = threading.RLock()
+
+        # count how often a derived image was reused or had to be computed
+        self.hits = 0
+        self.misses = 0
+
+    # start a new frame and drop all images derived from the previous one
+    def new_frame(self, frame):
+
+        with self.lock:
+            self.frame = frame
+            self.derived_images.clear()
+            self.mask = None
+
+    # set the mask for the current frame
+    def set_mask(self, mask):
+
+        with self.lock:
+            self.mask = mask
+            self.derived_images.pop("edges", None)
+
+    # return the derived image with the given name, compute it if it is not cached yet
+    def get(self, name, frame, compute):
+
+        with self.lock:
+
+            # a frame which differs from the cached one starts a new frame
+            if frame is not self.frame:
+                self.new_frame(frame)
+
+            image = self.derived_images.get(name)
+            if image is None:
+                self.misses += 1
+                image = compute(frame)
+                self.derived_images[name] = image
+            else:
+                self.hits += 1
+
+            return image
+
+    # return the frame converted to hsv
+    def get_hsv(self, frame):
+        return self.get("hsv", frame, lambda f: cv2.cvtColor(f, cv2.COLOR_BGR2HSV))
+
+    # return the frame converted to grayscale
+    def get_gray(self, frame):
+        return self.get("gray", frame, lambda f: cv2.cvtColor(f, cv2.COLOR_BGR2GRAY))
+
+    # return the edges found in the inverted grayscale frame
+    # if a region (x, y, width, height) is given only the edges of this part of the frame are returned,
+    # they are cut from the edges of the whole frame if these are cached already
+    def get_edges(self, frame, region=None):
+
+        if region is None:
+            return self.get("edges", frame, lambda f: self.compute_edges(self.get_gray(f), self.mask))
+
+        region_x, region_y, region_width, region_height = region
+        with self.lock:
+            if frame is self.frame and "edges" in self.derived_images:
+                self.hits += 1
+                edges = self.derived_images["edges"]
+                return edges[region_y:region_y + region_height, region_x:region_x + region_width]
+
+        gray = self.get_gray(frame)[region_y:region_y + region_height, region_x:region_x + region_width]
+        mask = self.get_mask(region)
+        return self.compute_edges(gray, mask)
+
+    # return the mask of the current frame or only of a region of it, None if no mask is set
+    def get_mask(self, region=None):
+
+        mask = self.mask
+        if mask is not None and region is not None:
+            region_x, region_y, region_width, region_height = region
+            mask = mask[region_y:region_y + region_height, region_x:region_x + region_width]
+
+        return mask
+
+    # find the edges in the inverted grayscale image and keep only those within the mask
+    @staticmethod
+    def compute_edges(gray, mask=None):
+
+        edges = cv2.Canny(255 - gray, CANNY_THRESHOLD_LOW, CANNY_THRESHOLD_HIGH)
+        if mask is not None:
+            edges = cv2.bitwise_and(edges, mask)
+
+        return edges
+
+    # return the hit and miss counters and reset them
+    def pop_statistics(self):
+
+        hits, misses = self.hits, self.misses
+        self.hits = 0
+        self.misses = 0
+
+        return hits, misses
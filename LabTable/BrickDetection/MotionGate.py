@@ -0,0 +1,131 @@
+import logging
+import math
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+from numpy import ndarray
+
+from LabTable.Model.Brick import Brick
+
+# enable logger
+logger = logging.getLogger(__name__)
+
+# Minimum gray value difference of a pixel to be counted as changed
+PIXEL_CHANGE_THRESHOLD = 25
+
+# Maximum value to use with the THRESH_BINARY
+MAX_VALUE = 255
+
+# If more than this share of tiles changed the whole frame is detected again
+MAX_CHANGED_TILES_RATIO = 0.5
+
+
+# this class compares each region of interest frame with the previously detected one on a grid of tiles
+# only the changed tiles have to be searched for bricks again, the bricks found
+# in the untouched tiles are carried forward from the previous frame
+class MotionGate:
+
+    def __init__(self, config):
+
+        self.tile_size = config.get("brick_detection", "tile_size")
+        self.tile_change_threshold = config.get("brick_detection", "tile_change_threshold")
+
+        # the gray frame the current detection results belong to
+        self.reference_gray = None
+
+        # grid of tiles which have to be detected again (None if the whole frame has to be detected)
+        self.changed_tiles: Optional[ndarray] = None
+
+        # the bricks and their contours found in the last frame
+        self.bricks: List[Brick] = []
+        self.brick_contours: List[ndarray] = []
+
+    # compare the gray frame with the reference frame
+    # returns the regions (x, y, width, height) which have to be detected again
+    # or None if the whole frame has to be detected
+    def update(self, gray) -> Optional[List[Tuple[int, int, int, int]]]:
+
+        # detect the whole frame if there is nothing to compare with
+        if self.reference_gray is None or self.reference_gray.shape != gray.shape:
+            self.reference_gray = gray.copy()
+            self.changed_tiles = None
+            return None
+
+        height, width = gray.shape
+        rows = math.ceil(height / self.tile_size)
+        columns = math.ceil(width / self.tile_size)
+
+        # compute the share of changed pixels for each tile
+        diff = cv2.absdiff(gray, self.reference_gray)
+        _, diff = cv2.threshold(diff, PIXEL_CHANGE_THRESHOLD, MAX_VALUE, cv2.THRESH_BINARY)
+        padded_diff = np.zeros((rows * self.tile_size, columns * self.tile_size), np.uint8)
+        padded_diff[:height, :width] = diff
+        tile_changes = cv2.resize(padded_diff, (columns, rows), interpolation=cv2.INTER_AREA) / MAX_VALUE
+
+        # also detect the neighbours of changed tiles again, so that bricks on tile borders are found completely
+        changed_tiles = (tile_changes > self.tile_change_threshold).astype(np.uint8)
+        changed_tiles = cv2.dilate(changed_tiles, np.ones((3, 3), np.uint8))
+
+        # detect the whole frame if most of it changed
+        if changed_tiles.mean() > MAX_CHANGED_TILES_RATIO:
+            self.reference_gray = gray.copy()
+            self.changed_tiles = None
+            return None
+
+        self.changed_tiles = changed_tiles.astype(bool)
+
+        # group the changed tiles to regions
+        regions = []
+        regions_number, _, stats, _ = cv2.connectedComponentsWithStats(changed_tiles, connectivity=8)
+        for label in range(1, regions_number):
+            tile_x, tile_y, tile_columns, tile_rows = stats[label, :4]
+            region_x = tile_x * self.tile_size
+            region_y = tile_y * self.tile_size
+            region_width = min(tile_columns * self.tile_size, width - region_x)
+            region_height = min(tile_rows * self.tile_size, height - region_y)
+            regions.append((int(region_x), int(region_y), int(region_width), int(region_height)))
+
+            # the detected regions are the new reference
+            self.reference_gray[region_y:region_y + region_height, region_x:region_x + region_width] = \
+                gray[region_y:region_y + region_height, region_x:region_x + region_width]
+
+        logger.debug("{} of {} tiles changed".format(np.count_nonzero(self.changed_tiles), rows * columns))
+
+        return regions
+
+    # check if the position lies in a tile which was detected again
+    def is_changed(self, x, y) -> bool:
+
+        row = min(int(y) // self.tile_size, self.changed_tiles.shape[0] - 1)
+        column = min(int(x) // self.tile_size, self.changed_tiles.shape[1] - 1)
+
+        return bool(self.changed_tiles[max(row, 0), max(column, 0)])
+
+    # combine the freshly detected bricks of the changed tiles with the bricks
+    # of the previous frame in the untouched tiles and return them with their contours
+    def merge(self, bricks: List[Brick], brick_contours: List[ndarray]) -> Tuple[List[Brick], List[ndarray]]:
+
+        if self.changed_tiles is not None:
+
+            merged_bricks = []
+            merged_contours = []
+
+            # carry forward the bricks found in untouched tiles
+            for brick, contour in zip(self.bricks, self.brick_contours):
+                if not self.is_changed(brick.centroid_x, brick.centroid_y):
+                    merged_bricks.append(brick)
+                    merged_contours.append(contour)
+
+            # add the freshly detected bricks of the changed tiles
+            for brick, contour in zip(bricks, brick_contours):
+                if self.is_changed(brick.centroid_x, brick.centroid_y):
+                    merged_bricks.append(brick)
+                    merged_contours.append(contour)
+
+            bricks, brick_contours = merged_bricks, merged_contours
+
+        self.bricks = bricks
+        self.brick_contours = brick_contours
+
+        return bricks, brick_contours
@@ -6,8 +6,11 @@
 # IR pattern removal
 
 import logging
+import threading
 from builtins import staticmethod
-from typing import Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import List, Optional, Tuple
 
 import cv2
 import numpy as np
@@ -16,6 +19,8 @@ import math
 from numpy import ndarray
 
 from LabTable.Model.Brick import Brick, BrickShape, BrickColor, Token
+from LabTable.BrickDetection.FrameCache import FrameCache, CANNY_THRESHOLD_LOW, CANNY_THRESHOLD_HIGH
+from LabTable.BrickDetection.BrickColorTable import BrickColorTable, HUE
 
 # enable logger
 logger = logging.getLogger(__name__)
@@ -35,22 +40,35 @@ BRICK_SHORT_SIDE = 1.58
 BRICK_LONG_SIDE = 3.18
 
 # Hue histogram configurations
-# Color channels
-HUE = 0
-SATURATION = 1
-VALUE = 2
 # Histogram size
 HIST_SIZE = 181
 
-# TODO: make masks configurable ?
-# OpenCV supports:
-# H-value range (0 to 180)
-# S-value range (0 to 255)
-# V-value range (0 to 255)
+# Color segmentation configurations
+# Kernel size of the morphological opening which removes single noisy pixels from the color masks
+OPENING_KERNEL_SIZE = 3
+# Side length of a rectangle with a variance of 1 along the side (variance of a uniform side is length^2 / 12)
+RECTANGLE_VARIANCE_FACTOR = 12
 
-# TODO: set in masks_configuration only hue and saturation/value separately, the same for all colors?
-MIN_SATURATION = 100
-MAX_SATURATION = 255
+# Maximum value of a mask
+MAX_VALUE = 255
+
+# Indices of the next sibling and the first child in the contour hierarchy
+HIERARCHY_NEXT = 0
+HIERARCHY_FIRST_CHILD = 2
+
+# Pyramid detection configurations
+# Relative tolerance of the brick dimensions when looking for candidates on a downscaled frame
+PYRAMID_TOLERANCE = 0.5
+# Padding in full resolution pixels around the candidates per pyramid level
+PYRAMID_PADDING = 4
+
+
+# the available algorithms to find brick candidates in a frame
+# CONTOURS: Canny edges and contours which are approximated by quadrangles
+# COLOR_SEGMENTATION: connected components of the configured colors in the hsv frame
+class DetectionBackend(Enum):
+    CONTOURS = "contours"
+    COLOR_SEGMENTATION = "color_segmentation"
 
 
 class ShapeDetector:
@@ -66,150 +84,609 @@ class ShapeDetector:
     min_rectangle_area = None
     max_rectangle_area = None
 
-    def __init__(self, config, output_stream):
+    def __init__(self, config, output_stream, frame_cache: FrameCache = None, color_table: BrickColorTable = None):
 
         self.config = config
         self.output_stream = output_stream
         self.resolution_width = config.get("video_resolution", "width")
-        self.masks_configuration = config.get("brick_colors")
 
+        # the configured brick colors compiled into a hsv lookup table
+        if color_table is None:
+            color_table = BrickColorTable(config)
+        self.color_table = color_table
+
+        # images derived from the current frame are shared between all contours
+        if frame_cache is None:
+            frame_cache = FrameCache()
+        self.frame_cache = frame_cache
+
+        # select the algorithm used to find bricks in a frame
+        self.backend = DetectionBackend(config.get("brick_detection", "backend"))
+        logger.info("using {} brick detection backend".format(self.backend.value))
+
+        self.opening_kernel = np.ones((OPENING_KERNEL_SIZE, OPENING_KERNEL_SIZE), np.uint8)
+
+        # find candidates on a downscaled frame and refine them in full resolution if pyramid levels are configured
+        self.pyramid_levels = config.get("brick_detection", "pyramid_levels")
+
+        # split the frame into overlapping tiles which are detected in parallel if more than one worker is configured
+        self.workers = config.get("brick_detection", "workers")
+        self.executor = None
+        if self.workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ShapeDetector")
+            logger.info("detecting bricks with {} workers".format(self.workers))
+
+        # count the found contours, the contours left after removing duplicates and the accepted bricks
+        # the counters may be increased by several detection workers at once
+        self.statistics_lock = threading.Lock()
+        self.raw_contours = 0
+        self.unique_contours = 0
+        self.accepted_bricks = 0
+
+    # Detect all bricks in the frame with the configured backend
+    # returns the bricks together with contours which outline them
+    # if regions (a list of (x, y, width, height) bounding boxes) are given only these parts are searched
+    def detect_frame(self, frame, regions=None) -> Tuple[List[Brick], List[ndarray]]:
+
+        # search only around candidates which were found on a downscaled frame
+        if self.pyramid_levels > 0:
+            regions = self.find_candidate_regions(frame, regions)
+
+        # the whole frame is searched if neither the given regions nor the pyramid candidates limit the search
+        whole_frame = regions is None
+        if whole_frame:
+            regions = [(0, 0, frame.shape[1], frame.shape[0])]
+
+        bricks = []
+        brick_contours = []
+
+        if self.executor:
+
+            # compute the shared derived images of the whole frame before the workers read them,
+            # limited searches compute the edges of their regions only
+            if whole_frame:
+                self.frame_cache.get_hsv(frame)
+                if self.backend is DetectionBackend.CONTOURS:
+                    self.frame_cache.get_edges(frame)
+
+            # detect all tiles of all regions in parallel
+            tiles = [tile for region in regions for tile in self.split_region(region)]
+            results = self.executor.map(lambda tile: self.detect_tile(frame, *tile), tiles)
+
+        else:
+            results = [self.detect_regions(frame, regions)]
+
+        for region_bricks, region_contours in results:
+            bricks += region_bricks
+            brick_contours += region_contours
+
+        with self.statistics_lock:
+            self.accepted_bricks += len(bricks)
+
+        return bricks, brick_contours
+
+    # stop the detection workers
+    def close(self):
+
+        if self.executor:
+            self.executor.shutdown()
+
+    # return the contour and brick counters and reset them
+    def pop_statistics(self):
+
+        with self.statistics_lock:
+            statistics = self.raw_contours, self.unique_contours, self.accepted_bricks
+            self.raw_contours = 0
+            self.unique_contours = 0
+            self.accepted_bricks = 0
+
+        return statistics
+
+    # Detect all bricks in some regions of the frame with the configured backend
+    def detect_regions(self, frame, regions) -> Tuple[List[Brick], List[ndarray]]:
+
+        if self.backend is DetectionBackend.COLOR_SEGMENTATION:
+            bricks = []
+            brick_contours = []
+            for region in regions:
+                region_bricks, region_contours = self.detect_bricks_by_color(frame, region)
+                bricks += region_bricks
+                brick_contours += region_contours
+            return bricks, brick_contours
+
+        # detect contours in all regions and check all of them at once
+        contours = []
+        holes = []
+        for region in regions:
+            region_contours, region_holes = self.detect_contours(frame, region)
+            contours += region_contours
+            holes += region_holes
+        return self.detect_bricks_with_holes(contours, holes, frame)
+
+    # Split a region into vertical tiles, one for each worker
+    # each tile owns a core stripe and overlaps its neighbours by more than the longest brick side,
+    # so that every brick lies completely in the tile which owns its centroid
+    # returns a list of (tile, core) pairs with (x, y, width, height) tiles and (start_x, end_x) cores
+    def split_region(self, region):
+
+        region_x, region_y, region_width, region_height = region
+        overlap = int(math.ceil(self.max_rectangle_length)) + BRICK_LENGTH_BUFFER
+
+        # do not split small regions into tiles which consist mostly of overlap
+        tiles_number = int(max(1, min(self.workers, region_width // (2 * overlap))))
+        borders = np.linspace(region_x, region_x + region_width, tiles_number + 1).astype(int)
+
+        tiles = []
+        for core_start_x, core_end_x in zip(borders[:-1], borders[1:]):
+            tile_start_x = max(region_x, core_start_x - overlap)
+            tile_end_x = min(region_x + region_width, core_end_x + overlap)
+            tile = (int(tile_start_x), region_y, int(tile_end_x - tile_start_x), region_height)
+            tiles.append((tile, (int(core_start_x), int(core_end_x))))
+
+        return tiles
+
+    # Detect all bricks in a tile and keep only those with a centroid in the core of the tile
+    # bricks in the overlap are merged this way, as each of them is kept only by the tile owning its centroid
+    # and bricks cut by the tile border are dropped, as their centroid never lies in the core
+    def detect_tile(self, frame, tile, core) -> Tuple[List[Brick], List[ndarray]]:
+
+        core_start_x, core_end_x = core
+        bricks = []
+        brick_contours = []
+
+        for brick, contour in zip(*self.detect_regions(frame, [tile])):
+            if core_start_x <= brick.centroid_x < core_end_x:
+                bricks.append(brick)
+                brick_contours.append(contour)
+
+        return bricks, brick_contours
+
+    # Find the regions around brick candidates on a frame downscaled by the configured pyramid levels
+    # returns full resolution (x, y, width, height) regions which lie within the given regions (or the whole frame)
+    def find_candidate_regions(self, frame, regions=None) -> List[Tuple[int, int, int, int]]:
+
+        level = self.pyramid_levels
+        scale = 2 ** level
+        small_frame = self.frame_cache.get("pyramid_{}".format(level), frame, lambda f: self.downscale(f, level))
+        min_length, max_length, min_area, max_area = self.get_brick_dimensions(level)
+
+        # Collect the bounding boxes of all blobs which might be bricks
+        if self.backend is DetectionBackend.COLOR_SEGMENTATION:
+            small_hsv = cv2.cvtColor(small_frame, cv2.COLOR_BGR2HSV)
+            small_mask = np.zeros(small_frame.shape[:2], np.uint8)
+            for color_ranges in self.color_table.color_ranges.values():
+                for lower, upper in color_ranges:
+                    small_mask = cv2.bitwise_or(small_mask, cv2.inRange(small_hsv, lower, upper))
+            _, _, stats, _ = cv2.connectedComponentsWithStats(small_mask, connectivity=8)
+            bboxes = stats[1:, :4]
+            areas = stats[1:, cv2.CC_STAT_AREA].astype(float)
+
+        else:
+            small_edges = cv2.Canny(255 - cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY),
+                                    CANNY_THRESHOLD_LOW, CANNY_THRESHOLD_HIGH)
+            major = cv2.__version__.split('.')[0]
+            if major == '3':
+                _, contours, _ = cv2.findContours(small_edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+            else:
+                contours, _ = cv2.findContours(small_edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+            if len(contours) == 0:
+                return []
+            areas = np.abs(self.calculate_contours_properties(contours)[0])
+            bboxes = np.array([cv2.boundingRect(contour) for contour in contours])
+
+        if len(bboxes) == 0:
+            return []
+
+        # Eliminate blobs with a wrong size using the thresholds of this level
+        longest_sides = bboxes[:, 2:4].max(axis=1)
+        candidates = (min_area <= areas) & (areas <= max_area) & (longest_sides <= max_length)
+
+        candidates_mask = np.zeros(small_frame.shape[:2], np.uint8)
+        for left_x, upper_y, width, height in bboxes[candidates]:
+            cv2.rectangle(candidates_mask, (int(left_x), int(upper_y)),
+                          (int(left_x + width - 1), int(upper_y + height - 1)), MAX_VALUE, cv2.FILLED)
+
+        # Keep only the candidates within the searched regions
+        if regions is not None:
+            regions_mask = np.zeros(small_frame.shape[:2], np.uint8)
+            for region_x, region_y, region_width, region_height in regions:
+                cv2.rectangle(regions_mask, (region_x // scale, region_y // scale),
+                              ((region_x + region_width) // scale, (region_y + region_height) // scale),
+                              MAX_VALUE, cv2.FILLED)
+            candidates_mask = cv2.bitwise_and(candidates_mask, regions_mask)
+
+        # Merge overlapping candidates and scale them up to padded full resolution regions
+        frame_height, frame_width = frame.shape[:2]
+        padding = PYRAMID_PADDING * level + BRICK_LENGTH_BUFFER
+        candidate_regions = []
+        regions_number, _, stats, _ = cv2.connectedComponentsWithStats(candidates_mask, connectivity=8)
+        for left_x, upper_y, width, height in stats[1:regions_number, :4]:
+            start_x = max(0, left_x * scale - padding)
+            start_y = max(0, upper_y * scale - padding)
+            end_x = min(frame_width, (left_x + width) * scale + padding)
+            end_y = min(frame_height, (upper_y + height) * scale + padding)
+            candidate_regions.append((int(start_x), int(start_y), int(end_x - start_x), int(end_y - start_y)))
+
+        logger.debug("found {} candidate regions on pyramid level {}".format(len(candidate_regions), level))
+
+        return candidate_regions
+
+    # Return the intersections of two lists of (x, y, width, height) regions
+    # if one of the lists is None (the whole frame) the other one is returned
+    @staticmethod
+    def intersect_regions(regions, other_regions):
+
+        if regions is None:
+            return other_regions
+        if other_regions is None:
+            return regions
+
+        intersections = []
+        for region_x, region_y, region_width, region_height in regions:
+            for other_x, other_y, other_width, other_height in other_regions:
+                start_x = max(region_x, other_x)
+                start_y = max(region_y, other_y)
+                end_x = min(region_x + region_width, other_x + other_width)
+                end_y = min(region_y + region_height, other_y + other_height)
+                if start_x < end_x and start_y < end_y:
+                    intersections.append((start_x, start_y, end_x - start_x, end_y - start_y))
+
+        return intersections
+
+    # Return the minimum and maximum brick side length and area for a pyramid level
+    # lengths shrink with the scale and areas with its square, a tolerance is added on lower levels
+    def get_brick_dimensions(self, level=0) -> Tuple[float, float, float, float]:
+
+        scale = 2 ** level
+        tolerance = PYRAMID_TOLERANCE if level > 0 else 0
+
+        min_length = self.min_square_length / scale * (1 - tolerance)
+        max_length = self.max_rectangle_length / scale * (1 + tolerance)
+        min_area = self.min_square_area / scale ** 2 * (1 - tolerance)
+        max_area = self.max_rectangle_area / scale ** 2 * (1 + tolerance)
+
+        return min_length, max_length, min_area, max_area
+
+    # Halve the resolution of the frame once for each level
+    @staticmethod
+    def downscale(frame, level):
+
+        for _ in range(level):
+            frame = cv2.pyrDown(frame)
+
+        return frame
 
     # Check if the contour is a brick
     def detect_brick(self, contour, frame) -> Optional[Brick]:
 
-        # Initialize the contour name and approximate the contour
-        # with Douglas-Peucker algorithm
-        epsilon = 0.1 * cv2.arcLength(contour, True)
-        approx = cv2.approxPolyDP(contour, epsilon, True)
+        bricks, _ = self.detect_bricks([contour], frame)
+        if bricks:
+            return bricks[0]
+        return None
+
+    # Check all contours of a frame at once and return the detected bricks together with their contours
+    # Cheap properties are computed for all contours in numpy arrays, so that most of the noise
+    # is rejected before any per contour work is done
+    def detect_bricks(self, contours, frame) -> Tuple[List[Brick], List[ndarray]]:
 
-        # Check if the contour has 4 vertices
-        if len(approx) == 4:
+        bricks = []
+        brick_contours = []
 
-            # Compute the centroid of the contour
-            moments_dict = cv2.moments(contour)
-            if moments_dict["m00"] != 0:
-                centroid_x = int((moments_dict["m10"] / moments_dict["m00"]))
-                centroid_y = int((moments_dict["m01"] / moments_dict["m00"]))
+        if len(contours) == 0:
+            return bricks, brick_contours
 
-                # Eliminate too small contours
-                area = cv2.contourArea(contour)
-                if self.min_square_area <= area <= self.max_rectangle_area:
+        # Compute area, centroid and perimeter of all contours in one pass
+        areas, centroids, perimeters = self.calculate_contours_properties(contours)
 
-                    # Check if contour is a rectangle or square
-                    contour_shape, aspect_ratio, rotated_bbox_lengths = self.classify_shape(approx)
-                    if contour_shape is not BrickShape.UNKNOWN_SHAPE:
+        # Eliminate degenerated, too small and too big contours
+        candidates = np.flatnonzero((areas != 0)
+                                    & (self.min_square_area <= np.abs(areas))
+                                    & (np.abs(areas) <= self.max_rectangle_area))
 
-                        # Compute the bounding box of the contour
-                        bbox = cv2.boundingRect(approx)
+        # Approximate the remaining contours with Douglas-Peucker algorithm
+        # and keep only those which have 4 vertices
+        quadrangles = []
+        quadrangle_candidates = []
+        for candidate in candidates:
+            approx = cv2.approxPolyDP(contours[candidate], 0.1 * perimeters[candidate], True)
+            if len(approx) == 4:
+                quadrangles.append(approx.reshape(4, 2))
+                quadrangle_candidates.append(candidate)
 
-                        # Find the most frequent color (heu value)
-                        # in the bounding box
-                        detected_color, avg_hue = self.classify_color(bbox, frame)
+        if not quadrangles:
+            return bricks, brick_contours
 
-                        # Eliminate wrong colors contours
-                        if detected_color is not BrickColor.UNKNOWN_COLOR:
+        quadrangles = np.array(quadrangles)
+        quadrangle_candidates = np.array(quadrangle_candidates)
 
-                            # return a Brick with the detected parameters
-                            token = Token(contour_shape, BrickColor[detected_color])
-                            brick = Brick(centroid_x, centroid_y, token)
-                            brick.aspect_ratio = aspect_ratio
-                            brick.relative_position = [] # TODO
-                            brick.average_detected_color = detected_color
-                            brick.detected_area = area
-                            brick.rotated_bbox_lengths = rotated_bbox_lengths
-                            brick.average_detected_color = avg_hue
+        # Check if the contours are rectangles or squares
+        rotated_bbox_lengths = self.calculate_rotated_bboxes_lengths(quadrangles)
+        shapes, aspect_ratios = self.classify_shapes(rotated_bbox_lengths)
 
-                            # log debug information
-                            logger.debug("created brick {} with area {} and hue {}".format(brick, area, avg_hue))
+        # Compute the bounding boxes of the approximated contours
+        bbox_min = quadrangles.min(axis=1)
+        bbox_size = quadrangles.max(axis=1) - bbox_min + 1
 
-                            return brick
-        return None
+        # Only create bricks for the contours which survived all shape checks
+        for idx in np.flatnonzero(shapes != BrickShape.UNKNOWN_SHAPE.value):
+
+            bbox = (int(bbox_min[idx][0]), int(bbox_min[idx][1]), int(bbox_size[idx][0]), int(bbox_size[idx][1]))
+
+            # Find the most frequent color (heu value)
+            # in the bounding box
+            detected_color, avg_hue = self.classify_color(bbox, frame)
+
+            # Eliminate wrong colors contours
+            if detected_color is not BrickColor.UNKNOWN_COLOR:
+
+                contour_idx = quadrangle_candidates[idx]
+                area = abs(float(areas[contour_idx]))
+                centroid_x, centroid_y = centroids[contour_idx]
+
+                # create a Brick with the detected parameters
+                token = Token(BrickShape(int(shapes[idx])), detected_color)
+                brick = Brick(int(centroid_x), int(centroid_y), token)
+                brick.aspect_ratio = float(aspect_ratios[idx])
+                brick.relative_position = [] # TODO
+                brick.detected_area = area
+                brick.rotated_bbox_lengths = rotated_bbox_lengths[idx]
+                brick.average_detected_color = avg_hue
+
+                # log debug information
+                logger.debug("created brick {} with area {} and hue {}".format(brick, area, avg_hue))
+
+                bricks.append(brick)
+                brick_contours.append(contours[contour_idx])
+
+        return bricks, brick_contours
+
+    # Check the contours and check the single hole of each outer boundary which was not accepted as a brick
+    # holes is a list with the single hole (or None) of each contour
+    def detect_bricks_with_holes(self, contours, holes, frame) -> Tuple[List[Brick], List[ndarray]]:
+
+        bricks, brick_contours = self.detect_bricks(contours, frame)
+
+        accepted_contours = {id(contour) for contour in brick_contours}
+        fallback_holes = [hole for contour, hole in zip(contours, holes)
+                          if hole is not None and id(contour) not in accepted_contours]
+        hole_bricks, hole_contours = self.detect_bricks(fallback_holes, frame)
+
+        return bricks + hole_bricks, brick_contours + hole_contours
+
+    # Find bricks as connected components of every configured color in the hsv frame
+    # returns the bricks together with their rotated bounding boxes as contours
+    def detect_bricks_by_color(self, frame, region=None) -> Tuple[List[Brick], List[ndarray]]:
+
+        bricks = []
+        brick_contours = []
+
+        # Convert the frame to hsv once for all colors and take only the searched region
+        frame_hsv = self.frame_cache.get_hsv(frame)
+        region_x, region_y = 0, 0
+        if region is not None:
+            region_x, region_y, region_width, region_height = region
+            frame_hsv = frame_hsv[region_y:region_y + region_height, region_x:region_x + region_width]
+
+        # Look up the color of every pixel once, so that overlapping ranges are resolved like in classify_color
+        frame_colors = self.color_table.classify(frame_hsv)
+
+        for color in self.color_table.colors:
+
+            # Mask all pixels which were classified as the color
+            color_mask = cv2.compare(frame_colors, color.value, cv2.CMP_EQ)
+
+            # Remove single noisy pixels and keep only the pixels within the mask of the frame
+            color_mask = cv2.morphologyEx(color_mask, cv2.MORPH_OPEN, self.opening_kernel)
+            frame_mask = self.frame_cache.get_mask(region)
+            if frame_mask is not None:
+                color_mask = cv2.bitwise_and(color_mask, frame_mask)
+
+            # Label only the part of the frame which contains the color
+            mask_x, mask_y, mask_width, mask_height = cv2.boundingRect(color_mask)
+            if mask_width == 0 or mask_height == 0:
+                continue
+            color_mask = color_mask[mask_y:mask_y + mask_height, mask_x:mask_x + mask_width]
+            color_hsv = frame_hsv[mask_y:mask_y + mask_height, mask_x:mask_x + mask_width]
+
+            # Get all blobs with their area, bounding box and centroid
+            _, labels, stats, centroids = cv2.connectedComponentsWithStats(color_mask, connectivity=8)
+
+            # Eliminate too small and too big blobs (label 0 is the background)
+            areas = stats[:, cv2.CC_STAT_AREA]
+            candidates = np.flatnonzero((self.min_square_area <= areas) & (areas <= self.max_rectangle_area))
+            candidates = candidates[candidates != 0]
+
+            if len(candidates) == 0:
+                continue
+
+            # Compute the side lengths and orientation of the blobs from their second order moments
+            rotated_bbox_lengths = np.zeros((len(candidates), 2))
+            angles = np.zeros(len(candidates))
+            for idx, label in enumerate(candidates):
+                left_x, upper_y, width, height = stats[label, :4]
+                blob = (labels[upper_y:upper_y + height, left_x:left_x + width] == label).astype(np.uint8)
+                moments_dict = cv2.moments(blob, True)
+
+                covariance = np.array([[moments_dict["mu20"], moments_dict["mu11"]],
+                                       [moments_dict["mu11"], moments_dict["mu02"]]]) / moments_dict["m00"]
+                variances = np.linalg.eigvalsh(covariance)[::-1]
+                rotated_bbox_lengths[idx] = np.sqrt(RECTANGLE_VARIANCE_FACTOR * np.maximum(variances, 0))
+                angles[idx] = 0.5 * math.atan2(2 * moments_dict["mu11"], moments_dict["mu20"] - moments_dict["mu02"])
+
+            # Check if the blobs are rectangles or squares
+            shapes, aspect_ratios = self.classify_shapes(rotated_bbox_lengths)
+
+            # Only create bricks for the blobs which survived all shape checks
+            for idx in np.flatnonzero(shapes != BrickShape.UNKNOWN_SHAPE.value):
+                label = candidates[idx]
+                left_x, upper_y, width, height, area = stats[label]
+                centroid_x, centroid_y = centroids[label]
+
+                # Save the most frequent hue value of the blob
+                blob_mask = labels[upper_y:upper_y + height, left_x:left_x + width] == label
+                blob_hsv = color_hsv[upper_y:upper_y + height, left_x:left_x + width]
+                avg_hue = int(np.argmax(np.bincount(blob_hsv[blob_mask][:, HUE], minlength=HIST_SIZE)))
+
+                # Move the centroid from the labeled part to the frame
+                centroid_x += region_x + mask_x
+                centroid_y += region_y + mask_y
+
+                # create a Brick with the detected parameters
+                token = Token(BrickShape(int(shapes[idx])), color)
+                brick = Brick(int(centroid_x), int(centroid_y), token)
+                brick.aspect_ratio = float(aspect_ratios[idx])
+                brick.relative_position = [] # TODO
+                brick.detected_area = float(area)
+                brick.rotated_bbox_lengths = rotated_bbox_lengths[idx]
+                brick.average_detected_color = avg_hue
+
+                logger.debug("created brick {} with area {} and hue {}".format(brick, area, avg_hue))
+
+                # outline the brick with its rotated bounding box
+                rotated_bbox = ((centroid_x, centroid_y), tuple(rotated_bbox_lengths[idx]), math.degrees(angles[idx]))
+                bricks.append(brick)
+                brick_contours.append(cv2.boxPoints(rotated_bbox).astype(np.int32).reshape(-1, 1, 2))
+
+        return bricks, brick_contours
+
+    # Compute signed area, centroid and perimeter of all contours at once
+    # using Green's theorem over the concatenated contour points (like cv2.moments does per contour)
+    @staticmethod
+    def calculate_contours_properties(contours) -> Tuple[ndarray, ndarray, ndarray]:
+
+        points_numbers = np.array([len(contour) for contour in contours])
+        starts = np.concatenate(([0], np.cumsum(points_numbers)[:-1]))
+        points = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+
+        # Every point is connected to the following one, the last point of each contour to its first one
+        next_idx = np.arange(1, len(points) + 1)
+        next_idx[starts + points_numbers - 1] = starts
+        x, y = points[:, 0], points[:, 1]
+        next_x, next_y = x[next_idx], y[next_idx]
+
+        cross = x * next_y - next_x * y
+        m00 = np.add.reduceat(cross, starts) / 2
+        m10 = np.add.reduceat((x + next_x) * cross, starts) / 6
+        m01 = np.add.reduceat((y + next_y) * cross, starts) / 6
+        perimeters = np.add.reduceat(np.hypot(next_x - x, next_y - y), starts)
+
+        # Compute the centroids, degenerated contours get a centroid of 0
+        safe_m00 = np.where(m00 != 0, m00, 1)
+        centroids = np.stack((np.trunc(m10 / safe_m00), np.trunc(m01 / safe_m00)), axis=1).astype(int)
+
+        return m00, centroids, perimeters
 
     # Check if the contour has a brick shape: square or rectangle
     def classify_shape(self, rotated_bbox) -> Tuple[BrickShape, float, ndarray]:
 
-        brick_shape = BrickShape.UNKNOWN_SHAPE
-        aspect_ratio = 0
         rotated_bbox_lengths = self.calculate_rotated_bbox_lengths(rotated_bbox)
         logger.debug("Rotated bbox size: {}".format(rotated_bbox_lengths))
 
-        # Prevent division by zero
-        if int(rotated_bbox_lengths[1]) is not 0:
-
-            # Compute the aspect ratio of the two lengths
-            aspect_ratio = int(rotated_bbox_lengths[0]) / int(rotated_bbox_lengths[1])
-            logger.debug("detected aspect ratio is {}".format(aspect_ratio))
+        shapes, aspect_ratios = self.classify_shapes(np.array([rotated_bbox_lengths]))
 
-            # Check if aspect ratio is near 1:1
-            if MIN_SQ <= aspect_ratio <= MAX_SQ:
+        return BrickShape(int(shapes[0])), float(aspect_ratios[0]), rotated_bbox_lengths
 
-                # Check if sides of the square brick are not too short/long
-                if not (self.min_square_length < rotated_bbox_lengths[0] < self.max_square_length) \
-                        and (self.min_square_length < rotated_bbox_lengths[1] < self.max_square_length):
-                    logger.debug("wrong square sides lengths")
+    # Classify the shapes for an array of rotated bounding box side lengths
+    # Returns the BrickShape values and the aspect ratios
+    def classify_shapes(self, rotated_bbox_lengths) -> Tuple[ndarray, ndarray]:
 
-                else:
-                    logger.debug("detected SQUARE brick contour")
-                    brick_shape = BrickShape.SQUARE_BRICK
+        first_lengths = rotated_bbox_lengths[:, 0]
+        second_lengths = rotated_bbox_lengths[:, 1]
 
-            # Check if aspect ratio is near 2:1
-            elif MIN_REC < aspect_ratio < MAX_REC:
+        # Compute the aspect ratio of the two lengths and prevent division by zero
+        first_int_lengths = first_lengths.astype(int)
+        second_int_lengths = second_lengths.astype(int)
+        valid = second_int_lengths != 0
+        aspect_ratios = np.zeros(len(rotated_bbox_lengths))
+        aspect_ratios[valid] = first_int_lengths[valid] / second_int_lengths[valid]
 
-                # Check if sides of the rectangle brick are not too short/long
-                if not (self.min_rectangle_length < rotated_bbox_lengths[0] < self.max_rectangle_length) \
-                        and (self.min_rectangle_length < rotated_bbox_lengths[1] < self.max_rectangle_length):
-                    logger.debug("wrong rectangle sides lengths")
+        # Check if aspect ratio is near 1:1 and the sides of the square brick are not too short/long
+        square_ratio = valid & (MIN_SQ <= aspect_ratios) & (aspect_ratios <= MAX_SQ)
+        wrong_square_lengths = \
+            ~((self.min_square_length < first_lengths) & (first_lengths < self.max_square_length)) \
+            & ((self.min_square_length < second_lengths) & (second_lengths < self.max_square_length))
 
-                else:
-                    logger.debug("detected RECTANGLE brick contour")
-                    brick_shape = BrickShape.RECTANGLE_BRICK
+        # Check if aspect ratio is near 2:1 and the sides of the rectangle brick are not too short/long
+        rectangle_ratio = valid & ~square_ratio & (MIN_REC < aspect_ratios) & (aspect_ratios < MAX_REC)
+        wrong_rectangle_lengths = \
+            ~((self.min_rectangle_length < first_lengths) & (first_lengths < self.max_rectangle_length)) \
+            & ((self.min_rectangle_length < second_lengths) & (second_lengths < self.max_rectangle_length))
 
-            # finally reject shape
-            else:
-                logger.debug("could not classify shape because of aspect ratio")
+        shapes = np.full(len(rotated_bbox_lengths), BrickShape.UNKNOWN_SHAPE.value)
+        shapes[square_ratio & ~wrong_square_lengths] = BrickShape.SQUARE_BRICK.value
+        shapes[rectangle_ratio & ~wrong_rectangle_lengths] = BrickShape.RECTANGLE_BRICK.value
 
-        return brick_shape, aspect_ratio, rotated_bbox_lengths
+        return shapes, aspect_ratios
 
     # Compute two sides lengths of the contour, which have a common corner
     @staticmethod
     def calculate_rotated_bbox_lengths(rotated_bbox) -> ndarray:
 
-        # Initialize a list for sides lengths of the contour
-        sides_lengths_list = []
+        return ShapeDetector.calculate_rotated_bboxes_lengths(np.array([np.reshape(rotated_bbox, (4, 2))]))[0]
+
+    # Compute two sides lengths, which have a common corner, for an array of quadrangles
+    @staticmethod
+    def calculate_rotated_bboxes_lengths(quadrangles) -> ndarray:
 
         # Compute three lengths for three corners of rotated bounding box
         # These are a triangle, a half of bounding box
-        for corner in range(3):
-            sides_lengths_list.append(np.linalg.norm(rotated_bbox[0] - rotated_bbox[corner + 1]))
+        sides_lengths = np.linalg.norm(quadrangles[:, :1] - quadrangles[:, 1:], axis=2)
 
         # Delete the highest length value, which is a diagonal of bounding box
         # Only two sides lengths, which have a common corner, are remaining in the array
-        rotated_bbox_lengths = np.delete(sides_lengths_list, np.argmax(sides_lengths_list))
+        keep = np.ones(sides_lengths.shape, dtype=bool)
+        keep[np.arange(len(sides_lengths)), np.argmax(sides_lengths, axis=1)] = False
 
-        return rotated_bbox_lengths
+        return sides_lengths[keep].reshape(-1, 2)
 
-    @staticmethod
-    def detect_contours(frame):
+    # if a region (x, y, width, height) is given only contours in this part of the frame are searched
+    # returns the contours together with a list of the single hole (or None) of each contour
+    def detect_contours(self, frame, region=None) -> Tuple[List[ndarray], List[Optional[ndarray]]]:
 
-        # Find all edges
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        frame_gray = 255 - frame_gray
-        edges = cv2.Canny(frame_gray, 30, 120)
+        # Find all edges in the searched region, the contours are moved back to frame coordinates
+        edges = self.frame_cache.get_edges(frame, region)
+        offset = (0, 0)
+        if region is not None:
+            offset = (region[0], region[1])
 
         # Find contours in the edges image
-        # Retrieve all of the contours without establishing any hierarchical relationships (RETR_LIST)
+        # Retrieve the outer boundaries and the holes of all edges in a two-level hierarchy (RETR_CCOMP)
         major = cv2.__version__.split('.')[0]
         if major == '3':
-            _, contours, hierarchy = cv2.findContours(edges.copy(), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+            _, contours, hierarchy = cv2.findContours(edges.copy(), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE,
+                                                      offset=offset)
         else:
-            contours, hierarchy = cv2.findContours(edges.copy(), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+            contours, hierarchy = cv2.findContours(edges.copy(), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE,
+                                                   offset=offset)
+
+        if len(contours) == 0:
+            return [], []
+
+        # A closed edge around a single brick yields an outer boundary and a nearly identical hole,
+        # only the outer boundary of those with exactly one hole is classified, so that each brick is found once
+        # the hole is kept aside and only checked if the outer boundary fails (e.g. as it merged with the board)
+        hierarchy = hierarchy[0]
+        first_children = hierarchy[:, HIERARCHY_FIRST_CHILD]
+        single_holes = (first_children != -1) & (hierarchy[first_children, HIERARCHY_NEXT] == -1)
+        duplicates = np.zeros(len(contours), dtype=bool)
+        duplicates[first_children[single_holes]] = True
 
-        return contours
+        unique_contours = []
+        holes = []
+        for idx in np.flatnonzero(~duplicates):
+            unique_contours.append(contours[idx])
+            holes.append(contours[first_children[idx]] if single_holes[idx] else None)
+
+        with self.statistics_lock:
+            self.raw_contours += len(contours)
+            self.unique_contours += len(unique_contours)
+
+        return unique_contours, holes
 
     # this is used to classify
     def classify_color(self, bbox, frame):
 
-        frame_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        frame_hsv = self.frame_cache.get_hsv(frame)
 
         # Save dimensions of the bounding box
         (left_x, upper_y, width, height) = bbox
@@ -220,43 +697,29 @@ class ShapeDetector:
         new_left_x = left_x + int(new_width / 2)
         new_upper_y = upper_y + int(new_height / 2)
 
-        # Create a histogram with hue values of pixels which already have a correct saturation
-        hue_histogram = np.zeros(HIST_SIZE)
-        max_frequency = 0
-        most_frequent_hue_value = None
-        for x in range(new_width):
-            for y in range(new_height):
-
-                # Take only the area of the brick bounding box
-                hsv_bbox = frame_hsv[new_upper_y + y, new_left_x + x]
-
-                # Check if saturation is correct
-                if MIN_SATURATION <= hsv_bbox[SATURATION] <= MAX_SATURATION:
-
-                    # Add hue value to the histogram
-                    hue_histogram[hsv_bbox[HUE]] += 1
+        # Take only the area of the brick bounding box
+        hsv_bbox = frame_hsv[new_upper_y:new_upper_y + new_height, new_left_x:new_left_x + new_width]
 
-                    # Save the most frequent hue value
-                    if hue_histogram[hsv_bbox[HUE]] > max_frequency:
-                        max_frequency = hue_histogram[hsv_bbox[HUE]]
-                        most_frequent_hue_value = hsv_bbox[HUE]
+        if hsv_bbox.size > 0:
 
-        if most_frequent_hue_value is not None:
-            # Iterate through all configured color ranges
-            for mask_color, mask_config in self.masks_configuration.items():
+            # Look up the configured color of every pixel and count the pixels per color
+            bbox_colors = self.color_table.classify(hsv_bbox)
+            color_frequencies = np.bincount(bbox_colors.ravel(), minlength=len(BrickColor))
+            color_frequencies[BrickColor.UNKNOWN_COLOR.value] = 0
 
-                # Check if found hue values are in any of configured color ranges
-                for entry in mask_config:
+            # TODO: currently only one of the most frequent colors will be returned as a detected color
+            if color_frequencies.max() > 0:
+                detected_color = BrickColor(int(np.argmax(color_frequencies)))
 
-                    # TODO: currently only one of the most frequent hue values will be returned as a detected color
-                    if entry[0][HUE] <= most_frequent_hue_value <= entry[1][HUE]:
-                        detected_color = mask_color
+                # Save the most frequent hue value of the pixels with the detected color
+                hue_histogram = np.bincount(hsv_bbox[bbox_colors == detected_color.value][:, HUE], minlength=HIST_SIZE)
+                most_frequent_hue_value = int(np.argmax(hue_histogram))
 
-                        # Return an accepted detected color name
-                        return detected_color, most_frequent_hue_value
+                # Return an accepted detected color
+                return detected_color, most_frequent_hue_value
 
         # Return if no configured color detected
-        return BrickColor.UNKNOWN_COLOR, most_frequent_hue_value
+        return BrickColor.UNKNOWN_COLOR, None
 
     @staticmethod
     def calculate_tangent(angle):
@@ -0,0 +1,96 @@
+import logging
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from LabTable.Model.Brick import Brick
+
+# enable logger
+logger = logging.getLogger(__name__)
+
+
+# this class indexes bricks by their centroid on a uniform grid of cells with a side length of cell_size
+# all bricks within cell_size in both dimensions of a position lie in the 3x3 cells around it,
+# so that finding a neighbour does not depend on the number of indexed bricks
+class SpatialGrid:
+
+    def __init__(self, cell_size):
+
+        self.cell_size = max(1, cell_size)
+        self.cells: Dict[Tuple[int, int], List[Brick]] = {}
+
+    # return the cell of a position
+    def get_cell(self, x, y) -> Tuple[int, int]:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    # index the brick at its current centroid
+    def add(self, brick: Brick):
+        self.cells.setdefault(self.get_cell(brick.centroid_x, brick.centroid_y), []).append(brick)
+
+    # remove the brick from the cell of its current centroid
+    def remove(self, brick: Brick):
+        self.remove_from_cell(brick, self.get_cell(brick.centroid_x, brick.centroid_y))
+
+    # remove the brick from the given cell, the brick is compared by identity as equal bricks may share a cell
+    def remove_from_cell(self, brick: Brick, cell: Tuple[int, int]):
+
+        cell_bricks = self.cells.get(cell, [])
+        for brick_idx, cell_brick in enumerate(cell_bricks):
+            if cell_brick is brick:
+                del cell_bricks[brick_idx]
+                if not cell_bricks:
+                    del self.cells[cell]
+                return
+
+        logger.warning("could not remove {} from the grid".format(brick))
+
+    # index the brick again after its centroid moved from the old position
+    def move(self, brick: Brick, old_x, old_y):
+
+        old_cell = self.get_cell(old_x, old_y)
+        if old_cell != self.get_cell(brick.centroid_x, brick.centroid_y):
+            self.remove_from_cell(brick, old_cell)
+            self.add(brick)
+
+    # drop all bricks
+    def clear(self):
+        self.cells.clear()
+
+    # index the given bricks again, e.g. after their centroids changed
+    def rebuild(self, bricks: Iterable[Brick]):
+
+        self.cells.clear()
+        for brick in bricks:
+            self.add(brick)
+
+    # return all bricks which lie within max_distance (at most cell_size) in both dimensions of the given brick
+    def find_neighbours(self, brick: Brick, max_distance) -> List[Brick]:
+
+        cell_x, cell_y = self.get_cell(brick.centroid_x, brick.centroid_y)
+        neighbours = []
+
+        for neighbour_cell_x in range(cell_x - 1, cell_x + 2):
+            for neighbour_cell_y in range(cell_y - 1, cell_y + 2):
+                for potential_neighbour in self.cells.get((neighbour_cell_x, neighbour_cell_y), ()):
+                    if self.get_distance(brick, potential_neighbour) <= max_distance:
+                        neighbours.append(potential_neighbour)
+
+        return neighbours
+
+    # return the closest brick which lies within max_distance (at most cell_size) in both dimensions
+    # of the given brick or None if there is no such brick
+    def find_neighbour(self, brick: Brick, max_distance) -> Optional[Brick]:
+
+        neighbours = self.find_neighbours(brick, max_distance)
+        if not neighbours:
+            return None
+
+        return min(neighbours, key=lambda neighbour: self.get_distance(brick, neighbour))
+
+    # return the larger distance of two bricks in both dimensions
+    @staticmethod
+    def get_distance(brick: Brick, other_brick: Brick):
+        return max(abs(other_brick.centroid_x - brick.centroid_x), abs(other_brick.centroid_y - brick.centroid_y))
+
+    # return the number of indexed bricks
+    def __len__(self):
+        return sum(len(cell_bricks) for cell_bricks in self.cells.values())
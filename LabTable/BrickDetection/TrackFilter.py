@@ -0,0 +1,34 @@
+from typing import Tuple
+
+
+# this class smooths the centroid of a tracked brick with a constant velocity alpha-beta filter
+# each measurement is compared with the position predicted from the last position and velocity,
+# alpha weights the measured against the predicted position and beta corrects the velocity with the residual
+class TrackFilter:
+
+    def __init__(self, x, y, alpha, beta):
+
+        self.alpha = alpha
+        self.beta = beta
+
+        # the smoothed position and velocity (pixels per frame)
+        self.x = float(x)
+        self.y = float(y)
+        self.velocity_x = 0.0
+        self.velocity_y = 0.0
+
+    # return the position expected in the next frame
+    def predict(self) -> Tuple[float, float]:
+        return self.x + self.velocity_x, self.y + self.velocity_y
+
+    # correct the prediction with a measured position
+    def update(self, x, y):
+
+        predicted_x, predicted_y = self.predict()
+        residual_x = x - predicted_x
+        residual_y = y - predicted_y
+
+        self.x = predicted_x + self.alpha * residual_x
+        self.y = predicted_y + self.alpha * residual_y
+        self.velocity_x += self.beta * residual_x
+        self.velocity_y += self.beta * residual_y
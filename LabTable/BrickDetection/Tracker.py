@@ -1,34 +1,40 @@
+import copy
 import logging
-from typing import List
+import time
+from collections import OrderedDict
+from itertools import chain
+from typing import Dict, List
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
 
 from LabTable.Model.Brick import Brick, BrickStatus, BrickShape, BrickColor, Token
 from LabTable.Model.ProgramStage import ProgramStage
-from LabTable.ExtentTracker import ExtentTracker
 from LabTable.Model.Extent import Extent
 from LabTable.BrickHandling.BrickHandler import BrickHandler
+from LabTable.BrickDetection.BrickColorTable import BrickColorTable
+from LabTable.BrickDetection.SpatialGrid import SpatialGrid
+from LabTable.BrickDetection.BrickStore import BrickStore
+from LabTable.BrickDetection.TrackFilter import TrackFilter
+from LabTable.TableContext import TableContext
 
 # configure logging
 logger = logging.getLogger(__name__)
 
+# Cost of a detection and a tracked brick which must not be associated (farther apart than match_distance
+# or with different tokens), it is larger than the cost of any allowed pair
+UNMATCHABLE_COST = 1e9
 
-class Tracker:
-
-    BRICKS_REFRESHED = False
 
-    tracked_candidates = {}  # we hold candidates which are not confirmed yet for some ticks
-    confirmed_bricks: List[Brick] = []
-    virtual_bricks: List[Brick] = []
-    tracked_disappeared = {}  # we hold confirmed bricks marked for removal after some ticks
-    min_distance: int = None
-    external_min_appeared: int = None
-    external_max_disappeared: int = None
-    brick_handler: BrickHandler = None
-    next_brick_id: int = 0
+# this class keeps track of the detected and virtual bricks of one table
+# all state is held by the instance and the TableContext of its table
+class Tracker:
 
-    def __init__(self, config, brick_handler):
+    def __init__(self, config, brick_handler, color_table: BrickColorTable, context: TableContext):
 
         self.config = config
-        self.extent_tracker = ExtentTracker.get_instance()
+        self.context = context
+        self.extent_tracker = context.extent_tracker
 
         # get ticker thresholds from config
         self.min_distance = config.get("tracker_thresholds", "min_distance")
@@ -36,33 +42,106 @@ class Tracker:
         self.external_max_disappeared = config.get("tracker_thresholds", "external_max_disappeared")
         self.internal_min_appeared = config.get("tracker_thresholds", "internal_min_appeared")
         self.internal_max_disappeared = config.get("tracker_thresholds", "internal_max_disappeared")
-
-        self.brick_handler = brick_handler
+        self.candidate_max_unseen = config.get("tracker_thresholds", "candidate_max_unseen")
+        self.max_candidates = config.get("tracker_thresholds", "max_candidates")
+        self.match_distance = config.get("tracker_thresholds", "match_distance")
+        self.smoothing_alpha = config.get("tracker_thresholds", "smoothing_alpha")
+        self.smoothing_beta = config.get("tracker_thresholds", "smoothing_beta")
+
+        # all detected bricks (candidates and confirmed) by their track id and their smoothed position and velocity
+        self.tracked_bricks: Dict[int, Brick] = {}
+        self.track_filters: Dict[int, TrackFilter] = {}
+        self.next_track_id = 0
+
+        # we hold candidates which are not confirmed yet for some ticks, ordered by the frame they were seen last
+        self.tracked_candidates: Dict[int, int] = OrderedDict()
+        self.candidates_last_seen: Dict[int, int] = {}
+        self.frame_number = 0
+        self.expired_candidates_number = 0
+        self.evicted_candidates_number = 0
+
+        # we hold confirmed bricks marked for removal after some ticks
+        self.tracked_disappeared: Dict[int, int] = {}
+
+        # index the tracked bricks on a grid with cells of min_distance, so that neighbours are found in the 3x3 cells
+        self.tracked_grid = SpatialGrid(self.min_distance)
+
+        # the confirmed and virtual bricks indexed by their object id, status and position
+        self.confirmed_bricks = BrickStore(self.min_distance)
+        self.virtual_bricks = BrickStore(self.min_distance)
+
+        self.brick_handler: BrickHandler = brick_handler
+        self.next_brick_id = 0
+
+        # the added and removed bricks which are passed to the brick handler together after batch_window seconds,
+        # keyed by the identity of the bricks so that a brick added and removed within the window is not passed
+        self.batch_window = config.get("brick_events", "batch_window")
+        self.pending_added_bricks: Dict[int, Brick] = {}
+        self.pending_removed_bricks: Dict[int, Brick] = {}
+        self.last_batch_time = time.monotonic()
+        self.cancelled_events_number = 0
 
         # we initialize it with all available configurations
         # as soon as an external game mode is choosen it should change accordingly
         # FIXME: this should maybe move in a change_gamemode()
         self.allowed_tokens: List[Token] = []
-        brick_colors = config.get("brick_colors")
-        for color in brick_colors:
+        for color in color_table.colors:
             for shape in BrickShape:
-                token = Token(shape, BrickColor[color])
+                token = Token(shape, color)
                 self.allowed_tokens.append(token)
 
         # Initialize a flag for changes in the map extent
         self.extent_changed = False
     
     def handle_new_brick(self, brick):
-        brick.object_id = self.next_brick_id
+
+        # the object id is indexed by the store holding the brick
+        bricks = self.virtual_bricks if brick in self.virtual_bricks else self.confirmed_bricks
+        bricks.set_object_id(brick, self.next_brick_id)
         self.next_brick_id += 1
 
-        brick.relative_position = self.extent_tracker.board \
-            .get_position_within_extent(brick.centroid_x, brick.centroid_y)
+        # send the smoothed position of detected bricks
+        position_x, position_y = brick.centroid_x, brick.centroid_y
+        track_filter = self.track_filters.get(brick.track_id)
+        if track_filter:
+            position_x, position_y = track_filter.x, track_filter.y
 
-        self.brick_handler.handle_new_brick(brick)
+        brick.relative_position = self.extent_tracker.board.get_position_within_extent(position_x, position_y)
+
+        self.pending_added_bricks[id(brick)] = brick
 
     def handle_removed_brick(self, brick):
-        self.brick_handler.handle_removed_brick(brick)
+
+        # a brick which was added in the same window is not passed at all
+        if self.pending_added_bricks.pop(id(brick), None) is not None:
+            self.cancelled_events_number += 2
+        else:
+            self.pending_removed_bricks[id(brick)] = brick
+
+    # passes the added and removed bricks to the brick handler in one batch once the batch window elapsed
+    # (or right away if forced)
+    def send_brick_batch(self, force=False):
+
+        now = time.monotonic()
+        if not force and now - self.last_batch_time < self.batch_window:
+            return
+        self.last_batch_time = now
+
+        if self.pending_added_bricks or self.pending_removed_bricks:
+            self.brick_handler.handle_brick_batch(list(self.pending_added_bricks.values()),
+                                                  list(self.pending_removed_bricks.values()))
+            self.pending_added_bricks.clear()
+            self.pending_removed_bricks.clear()
+
+    # passes all external bricks to the brick handler, e.g. to let a client resync after it reconnected
+    # the pending changes are passed before, so that the snapshot matches the changes passed so far
+    def send_brick_snapshot(self):
+
+        self.send_brick_batch(force=True)
+
+        bricks = list(chain(self.confirmed_bricks.get_by_status(BrickStatus.EXTERNAL_BRICK),
+                            self.virtual_bricks.get_by_status(BrickStatus.EXTERNAL_BRICK)))
+        self.brick_handler.handle_brick_snapshot(bricks)
 
     # re-initialize the tracker after the game mode changed
     def change_game_mode(self, allowed_tokens: List[Token]):
@@ -70,30 +149,46 @@ class Tracker:
         logger.info("the following tokens are allowed:")
         for token in self.allowed_tokens:
             logger.info("{}".format(token))
+            if token.svg is not None:
+                self.context.token_icons[token] = token.svg
         self.tracked_disappeared.clear()
         self.virtual_bricks.clear()
         self.confirmed_bricks.clear()
         self.tracked_candidates.clear()
+        self.candidates_last_seen.clear()
+        self.tracked_bricks.clear()
+        self.tracked_grid.clear()
+        self.track_filters.clear()
 
     # for externally remove tracked bricks
     def remove_external_brick(self, object_id):
-        for brick in self.virtual_bricks:
-            if brick.object_id == object_id:
-                self.virtual_bricks.remove(brick)
+        for brick in self.virtual_bricks.get_by_object_id(object_id):
+            self.remove_virtual_brick(brick)
 
     # for externally add a tracked brick
     def add_external_brick(self, brick: Brick):
         # TODO: maybe add security checks to not add the same brick twice etc?
         Extent.calc_local_pos(brick, self.extent_tracker.board, self.extent_tracker.map_extent)
-        self.virtual_bricks.append(brick)
+        self.add_virtual_brick(brick)
+
+    # add a virtual brick (e.g. placed with the mouse)
+    def add_virtual_brick(self, brick: Brick):
+        self.virtual_bricks.add(brick)
+
+    # remove a virtual brick
+    def remove_virtual_brick(self, brick: Brick):
+        self.virtual_bricks.remove(brick)
 
     # called once a frame while in ProgramStage EVALUATION or PLANNING
-    # keeps track of bricks and returns a list of all currently confirmed bricks
+    # keeps track of bricks and returns a read-only view of all currently confirmed bricks
     def update(self, brick_candidates: List[Brick], program_stage: ProgramStage):
 
         # count frames certain bricks have been continuously visible / gone
         self.do_brick_ticks(brick_candidates)
 
+        # forget candidates that have not been seen for too long
+        self.expire_candidates()
+
         # remove all bricks that have been gone for too long
         self.remove_overtime_disappeared_bricks()
 
@@ -107,59 +202,205 @@ class Tracker:
 
         self.mark_external_bricks_outdated_if_map_updated()
 
-        # finally, return the updated list of confirmed bricks
-        return self.confirmed_bricks
+        # pass the changes of this frame (or batch window) to the brick handler
+        self.send_brick_batch()
+
+        # answer a request for the state of all bricks
+        if self.brick_handler.pop_snapshot_request():
+            self.send_brick_snapshot()
+
+        # finally, return the updated confirmed bricks
+        return self.confirmed_bricks.view()
 
     # iterates over all candidates and manages their tick counters
     def do_brick_ticks(self, brick_candidates: List[Brick]):
 
-        # copy the confirmed bricks
-        possible_removed_bricks = self.confirmed_bricks.copy()
+        self.frame_number += 1
+
+        # the track ids of the confirmed bricks which were not seen in this frame
+        possible_removed_track_ids = set(brick.track_id for brick in self.confirmed_bricks)
+
+        # associate the candidates of this frame with the confirmed bricks first
+        # and only the remaining candidates with the unconfirmed ones, so that a close unconfirmed duplicate
+        # of a confirmed brick can not take its detections
+        matches = self.associate(brick_candidates, range(len(brick_candidates)), True)
+        matches.update(self.associate(
+            brick_candidates, [idx for idx in range(len(brick_candidates)) if idx not in matches], False))
 
         # iterate through all candidates
-        for candidate in brick_candidates:
+        for candidate_idx, candidate in enumerate(brick_candidates):
 
-            # remove the candidate from the possible removed bricks
-            if candidate in possible_removed_bricks:
-                possible_removed_bricks.remove(candidate)
+            track_id = matches.get(candidate_idx)
+            if track_id is not None:
+                self.update_track(track_id, candidate)
 
-            # check if this candidate is already in the list
-            if candidate not in self.confirmed_bricks:
+            if track_id is None:
 
-                # check if candidate is in minimum distance to any of confirmed bricks
-                neighbour_brick = self.check_min_distance(candidate, self.confirmed_bricks)
-                if not neighbour_brick:
+                # a candidate close to a confirmed brick which could not be associated with it
+                # (e.g. a second detection of it or a detection with another token) is no new brick
+                if self.check_min_distance(candidate, self.confirmed_bricks):
+                    continue
 
-                    # create or add a tick if it's not yet confirmed
-                    if candidate in self.tracked_candidates:
-                        self.tracked_candidates[candidate] += 1
-                    else:
-                        self.tracked_candidates[candidate] = 0
+                # start tracking a new candidate
+                self.add_track(candidate)
+
+            elif track_id in self.tracked_candidates:
+
+                # add a tick if it's not yet confirmed
+                self.tracked_candidates[track_id] += 1
+                self.set_candidate_seen(track_id)
 
-                else:
-                    self.tracked_candidates[neighbour_brick] += 1
             else:
                 # if the brick reappeared stop tracking it as disappeared
-                if candidate in self.tracked_disappeared:
-                    del self.tracked_disappeared[candidate]
+                possible_removed_track_ids.discard(track_id)
+                self.tracked_disappeared.pop(track_id, None)
 
         # start tracking the not reappeared bricks as possible removed
-        for possible_removed_brick in possible_removed_bricks:
+        for track_id in possible_removed_track_ids:
 
-            if possible_removed_brick in self.tracked_disappeared:
-                self.tracked_disappeared[possible_removed_brick] += 1
+            if track_id in self.tracked_disappeared:
+                self.tracked_disappeared[track_id] += 1
             else:
-                self.tracked_disappeared[possible_removed_brick] = 0
+                self.tracked_disappeared[track_id] = 0
+
+    # associates the candidates of a frame with the tracked bricks so that the summed squared distance
+    # to the predicted positions of the tracked bricks is minimal
+    # only pairs with the same token within match_distance are allowed, every tracked brick gets at most one candidate
+    # only the candidates with the given indices are associated with either the confirmed or the unconfirmed bricks
+    # returns a dict of the candidate index and the track id of its tracked brick
+    def associate(self, brick_candidates: List[Brick], candidate_indices, confirmed: bool) -> Dict[int, int]:
+
+        # collect the tracked bricks which lie close to any candidate,
+        # so that the size of the problem does not depend on the number of tracked bricks
+        track_ids = []
+        track_indices = {}
+        gated_pairs = []
+        for row_idx, candidate_idx in enumerate(candidate_indices):
+            candidate = brick_candidates[candidate_idx]
+            for tracked_brick in self.tracked_grid.find_neighbours(candidate, self.min_distance):
+
+                if tracked_brick.token != candidate.token \
+                        or (tracked_brick.track_id not in self.tracked_candidates) != confirmed:
+                    continue
+
+                predicted_x, predicted_y = self.track_filters[tracked_brick.track_id].predict()
+                distance_x = predicted_x - candidate.centroid_x
+                distance_y = predicted_y - candidate.centroid_y
+                if max(abs(distance_x), abs(distance_y)) > self.match_distance:
+                    continue
+
+                if tracked_brick.track_id not in track_indices:
+                    track_indices[tracked_brick.track_id] = len(track_ids)
+                    track_ids.append(tracked_brick.track_id)
+
+                gated_pairs.append((row_idx, track_indices[tracked_brick.track_id],
+                                    distance_x * distance_x + distance_y * distance_y))
+
+        if not gated_pairs:
+            return {}
+
+        cost_matrix = np.full((len(candidate_indices), len(track_ids)), UNMATCHABLE_COST)
+        for row_idx, track_idx, cost in gated_pairs:
+            cost_matrix[row_idx, track_idx] = cost
+
+        # solve the assignment and drop pairs which were only assigned because of the rectangular matrix
+        matches = {}
+        for row_idx, track_idx in zip(*linear_sum_assignment(cost_matrix)):
+            if cost_matrix[row_idx, track_idx] < UNMATCHABLE_COST:
+                matches[candidate_indices[row_idx]] = track_ids[track_idx]
+
+        return matches
+
+    # starts tracking a new candidate
+    # the tracked brick is a copy of the candidate, as it is moved to the smoothed position later on
+    # and the detected bricks may be passed again (e.g. by the MotionGate for untouched tiles)
+    def add_track(self, candidate: Brick):
+
+        brick = copy.copy(candidate)
+        brick.track_id = self.next_track_id
+        self.next_track_id += 1
+
+        self.tracked_bricks[brick.track_id] = brick
+        self.tracked_grid.add(brick)
+        self.track_filters[brick.track_id] = TrackFilter(brick.centroid_x, brick.centroid_y,
+                                                         self.smoothing_alpha, self.smoothing_beta)
+        self.tracked_candidates[brick.track_id] = 0
+        self.set_candidate_seen(brick.track_id)
+
+    # smooths the position of a tracked brick with the associated candidate
+    # and moves the brick to the smoothed position
+    def update_track(self, track_id: int, candidate: Brick):
+
+        track_filter = self.track_filters[track_id]
+        track_filter.update(candidate.centroid_x, candidate.centroid_y)
+
+        brick = self.tracked_bricks[track_id]
+        old_x, old_y = brick.centroid_x, brick.centroid_y
+        brick.centroid_x = int(round(track_filter.x))
+        brick.centroid_y = int(round(track_filter.y))
+
+        if (brick.centroid_x, brick.centroid_y) != (old_x, old_y):
+            self.tracked_grid.move(brick, old_x, old_y)
+            self.confirmed_bricks.move(brick, old_x, old_y)
+
+    # remembers that a candidate was seen in this frame
+    # the candidates stay ordered by the frame they were seen last, the least recently seen first
+    def set_candidate_seen(self, track_id: int):
+
+        self.tracked_candidates.move_to_end(track_id)
+        self.candidates_last_seen[track_id] = self.frame_number
+
+    # removes the candidates which have not been seen for more than candidate_max_unseen frames and
+    # the least recently seen candidates above max_candidates
+    # only the least recently seen candidates at the start of the dict have to be checked
+    def expire_candidates(self):
+
+        while self.tracked_candidates:
+
+            track_id = next(iter(self.tracked_candidates))
+
+            if self.frame_number - self.candidates_last_seen[track_id] > self.candidate_max_unseen:
+                self.expired_candidates_number += 1
+            elif len(self.tracked_candidates) > self.max_candidates:
+                self.evicted_candidates_number += 1
+            else:
+                break
+
+            self.remove_candidate(track_id)
+
+    # stops tracking a candidate
+    def remove_candidate(self, track_id: int):
+
+        del self.tracked_candidates[track_id]
+        del self.candidates_last_seen[track_id]
+        del self.track_filters[track_id]
+        self.tracked_grid.remove(self.tracked_bricks.pop(track_id))
+
+    # returns the sizes of the tracker state and the number of candidates removed so far
+    def get_statistics(self) -> Dict[str, int]:
+
+        return {
+            "tracked bricks": len(self.tracked_bricks),
+            "candidates": len(self.tracked_candidates),
+            "confirmed": len(self.confirmed_bricks),
+            "disappeared": len(self.tracked_disappeared),
+            "virtual": len(self.virtual_bricks),
+            "expired candidates": self.expired_candidates_number,
+            "evicted candidates": self.evicted_candidates_number,
+            "cancelled events": self.cancelled_events_number
+        }
 
     # removes those bricks that have been invisible for too long
     def remove_overtime_disappeared_bricks(self):
 
         # we temporarily save disappeared
         # elements to delete them from dicts
-        bricks_to_remove = []
+        track_ids_to_remove = []
 
         # remove the disappeared elements
-        for brick, amount in self.tracked_disappeared.items():
+        for track_id, amount in self.tracked_disappeared.items():
+
+            brick = self.tracked_bricks[track_id]
 
             # select correct threshold on whether the brick is internal or not
             # (internal bricks disappear faster)
@@ -171,53 +412,54 @@ class Tracker:
             if amount > target_disappeared:
 
                 # remember disappeared elements to delete them from dicts
-                bricks_to_remove.append(brick)
+                track_ids_to_remove.append(track_id)
 
                 # remove the disappeared elements from the confirmed list
                 self.confirmed_bricks.remove(brick)
-                Tracker.BRICKS_REFRESHED = True
+                self.context.bricks_refreshed = True
 
                 # if the brick is associated with an object also send a remove request to the server
                 if brick.status == BrickStatus.EXTERNAL_BRICK:
                     self.handle_removed_brick(brick)
 
         # remove the disappeared elements from dicts
-        for brick in bricks_to_remove:
-            del self.tracked_candidates[brick]
-            del self.tracked_disappeared[brick]
+        for track_id in track_ids_to_remove:
+            self.tracked_grid.remove(self.tracked_bricks.pop(track_id))
+            del self.track_filters[track_id]
+            del self.tracked_disappeared[track_id]
 
     # does ui update for all already confirmed bricks and mark as outdated if necessary
     def do_confirmed_ui_update(self):
 
-        for brick in self.confirmed_bricks:
-
-            # mark all bricks as outdated that previously were on ui and now lie on the map or vice versa
-            # this might happen when a ui elements visibility gets toggled
-            if brick.status == BrickStatus.INTERNAL_BRICK:
-                Tracker.set_brick_outdated(brick)
+        # mark all bricks as outdated that previously were on ui and now lie on the map or vice versa
+        # this might happen when a ui elements visibility gets toggled
+        for brick in list(self.confirmed_bricks.get_by_status(BrickStatus.INTERNAL_BRICK)):
+            self.set_brick_outdated(brick)
 
     def remove_old_virtual_bricks(self):
 
-        # update virtual bricks
-        for v_brick in self.virtual_bricks:
-
-            # remove any virtual internal bricks that do not lie on ui elements anymore
-            if v_brick.status == BrickStatus.INTERNAL_BRICK:
-                self.virtual_bricks.remove(v_brick)
+        # remove any virtual internal bricks that do not lie on ui elements anymore
+        for v_brick in list(self.virtual_bricks.get_by_status(BrickStatus.INTERNAL_BRICK)):
+            self.remove_virtual_brick(v_brick)
 
     # selects those candidates that appeared long enough to be considered confirmed and add them to the confirmed list
     # also does ui update for those bricks and classifies them
     def select_and_classify_candidates(self, program_stage):
 
         # add the qualified candidates to the confirmed list and do ui update for them
-        for candidate, amount in self.tracked_candidates.items():
+        for track_id, amount in list(self.tracked_candidates.items()):
 
             # select the correct threshold on whether or not the candidate would be internal
             # (internal bricks appear faster)
             target_appeared = self.external_min_appeared
 
             # check for the threshold value of new candidates
-            if amount > target_appeared and candidate not in self.confirmed_bricks:
+            if amount > target_appeared:
+
+                # the candidate is confirmed now and is only tracked as disappeared from now on
+                candidate = self.tracked_bricks[track_id]
+                del self.tracked_candidates[track_id]
+                del self.candidates_last_seen[track_id]
 
                 # if the brick is on top of a virtual brick, remove it and mark the brick as outdated
                 virtual_brick = self.check_min_distance(candidate, self.virtual_bricks)
@@ -234,41 +476,23 @@ class Tracker:
                     else:
                         candidate.status = BrickStatus.OUTDATED_BRICK
 
-                # add a new brick to the confirmed bricks list
-                self.confirmed_bricks.append(candidate)
+                # add a new brick to the confirmed bricks
+                self.confirmed_bricks.add(candidate)
 
-                Tracker.BRICKS_REFRESHED = True
+                self.context.bricks_refreshed = True
 
         # loop through all virtual candidates (= all mouse placed bricks on first frame) and set correct status
-        for brick in filter(lambda b: b.status == BrickStatus.CANDIDATE_BRICK, self.virtual_bricks):
-            Tracker.BRICKS_REFRESHED = True
+        for brick in list(self.virtual_bricks.get_by_status(BrickStatus.CANDIDATE_BRICK)):
+            self.context.bricks_refreshed = True
 
             logger.debug("classifying mouse brick {}".format(brick))
 
-            brick.status = BrickStatus.EXTERNAL_BRICK
+            self.virtual_bricks.set_status(brick, BrickStatus.EXTERNAL_BRICK)
             self.handle_new_brick(brick)
 
-    # Check if the brick lies within min distance to the any in the list, returns None if no neighbour was found
-    def check_min_distance(self, brick: Brick, bricks_list) -> [None, Brick]:
-
-        neighbour_brick = None
-
-        # Look for brick within min distance
-        for potential_neighbour in bricks_list:
-
-            # Compute distance in both dimensions
-            distance_x = abs(potential_neighbour.centroid_x - brick.centroid_x)
-            distance_y = abs(potential_neighbour.centroid_y - brick.centroid_y)
-
-            # If distances are smaller than min the neighbour brick is found
-            if (distance_x <= self.min_distance) & (distance_y <= self.min_distance):
-                neighbour_brick = potential_neighbour
-
-                # Return the found neighbour brick
-                return neighbour_brick
-
-        # Return None, no neighbour brick found
-        return neighbour_brick
+    # Check if the brick lies within min distance to any brick of the store, returns None if no neighbour was found
+    def check_min_distance(self, brick: Brick, bricks: BrickStore) -> [None, Brick]:
+        return bricks.find_neighbour(brick, self.min_distance)
 
     # marks external bricks as outdated if the map was updated
     def mark_external_bricks_outdated_if_map_updated(self):
@@ -278,9 +502,11 @@ class Tracker:
         if self.extent_changed is True:
 
             logger.debug("recalculate virtual brick position")
-            for brick in self.virtual_bricks:
-                if brick.status == BrickStatus.EXTERNAL_BRICK:
-                    Extent.calc_local_pos(brick, self.extent_tracker.board, self.extent_tracker.map_extent)
+            for brick in self.virtual_bricks.get_by_status(BrickStatus.EXTERNAL_BRICK):
+                Extent.calc_local_pos(brick, self.extent_tracker.board, self.extent_tracker.map_extent)
+
+            # the positions of the virtual bricks changed
+            self.virtual_bricks.reindex_positions()
 
             logger.info("set bricks outdated because extent changed")
             self.invalidate_external_bricks()
@@ -288,35 +514,33 @@ class Tracker:
             # set the flag back
             self.extent_tracker.extent_changed = False
 
-    @staticmethod
-    def set_brick_outdated(brick: Brick):
+    def set_brick_outdated(self, brick: Brick):
 
-        brick.status = BrickStatus.OUTDATED_BRICK
-        Tracker.BRICKS_REFRESHED = True
+        self.confirmed_bricks.set_status(brick, BrickStatus.OUTDATED_BRICK)
+        self.context.bricks_refreshed = True
 
     def set_virtual_brick_at_global_pos_of(self, brick: Brick):
 
         virtual_brick = brick.clone()
         Extent.calc_local_pos(virtual_brick, self.extent_tracker.board, self.extent_tracker.map_extent)
 
-        self.virtual_bricks.append(virtual_brick)
-        Tracker.BRICKS_REFRESHED = True
+        self.add_virtual_brick(virtual_brick)
+        self.context.bricks_refreshed = True
 
     def remove_external_virtual_brick(self, brick: Brick):
 
         self.handle_removed_brick(brick)
-        self.virtual_bricks.remove(brick)
+        self.remove_virtual_brick(brick)
 
     # sets all external bricks to outdated
     def invalidate_external_bricks(self):
 
         return
 
-        for brick in self.confirmed_bricks:
-            if brick.status == BrickStatus.EXTERNAL_BRICK:
-                # change status of bricks to outdated
-                self.set_virtual_brick_at_global_pos_of(brick)
-                Tracker.set_brick_outdated(brick)
+        for brick in list(self.confirmed_bricks.get_by_status(BrickStatus.EXTERNAL_BRICK)):
+            # change status of bricks to outdated
+            self.set_virtual_brick_at_global_pos_of(brick)
+            self.set_brick_outdated(brick)
 
     # checks if the brick is allowed in the current program stage
     def check_brick_valid(self, brick: Brick):
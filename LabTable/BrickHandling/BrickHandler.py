@@ -1,3 +1,5 @@
+from typing import List
+
 from LabTable.Model.Brick import Brick, BrickStatus, BrickShape, BrickColor, Token
 
 
@@ -8,3 +10,29 @@ class BrickHandler:
 
     def handle_removed_brick(self, Brick):
         pass
+
+    # handles the bricks added and removed within one frame (or batch window) together
+    # by default each brick is handled on its own
+    def handle_brick_batch(self, added_bricks: List[Brick], removed_bricks: List[Brick]):
+
+        for brick in removed_bricks:
+            self.handle_removed_brick(brick)
+
+        for brick in added_bricks:
+            self.handle_new_brick(brick)
+
+    # returns true once after a client asked for the state of all bricks
+    def pop_snapshot_request(self) -> bool:
+        return False
+
+    # handles all bricks which are currently on the table, e.g. to answer a snapshot request
+    def handle_brick_snapshot(self, bricks: List[Brick]):
+        pass
+
+    # returns metrics of the handler (e.g. the number of queued events)
+    def get_statistics(self):
+        return {}
+
+    # releases the resources of the handler
+    def close(self):
+        pass
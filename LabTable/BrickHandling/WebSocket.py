@@ -1,35 +1,249 @@
-from .BrickHandler import BrickHandler
-import websocket
 import json
+import logging
+import select
+import threading
+import time
+from collections import deque
+
+import websocket
+
+from .BrickHandler import BrickHandler
+
+# enable logger
+logger = logging.getLogger(__name__)
+
+# Weight of the latest send latency in the moving average
+LATENCY_SMOOTHING = 0.1
 
-WEBSOCKET_URL = "ws://127.0.0.1:14541"
+# Seconds the background thread waits for new events before it checks for requests of the LandscapeLab
+RECEIVE_INTERVAL = 0.1
 
+
+# this class sends the brick events to the LandscapeLab without blocking the frame processing
+# the tracker only puts the events into a bounded queue, which is drained by a background thread
+# the thread (re)connects with an exponential backoff, so a slow or lost client does not stop the table
+# every message carries a sequence number which increases by one per message,
+# so that the LandscapeLab notices lost events and can ask for a snapshot of all bricks with {"event": "get_snapshot"}
+# the snapshot is queued like any other message, the events with a higher sequence number follow it
+# NOTE: if the queue is full the oldest events are dropped
 class WebSocketBrickHandler(BrickHandler):
 
-    ws = None
+    def __init__(self, config):
+
+        self.url = config.get("websocket", "url")
+        self.queue_size = config.get("websocket", "queue_size")
+        self.min_backoff = config.get("websocket", "min_backoff")
+        self.max_backoff = config.get("websocket", "max_backoff")
+        self.timeout = config.get("websocket", "timeout")
+        self.batch_messages = config.get("websocket", "batch_messages")
+
+        # the events waiting to be sent with the time they were queued, guarded by the condition
+        self.events = deque()
+        self.events_condition = threading.Condition()
+
+        # the sequence number of the last queued message, guarded by the condition
+        self.sequence_number = 0
 
-    def __init__(self):
-        self.ws = websocket.WebSocket()
-        self.ws.connect(WEBSOCKET_URL)
+        # set by the thread if the LandscapeLab asked for a snapshot, it is answered by the main thread
+        self.snapshot_requested = threading.Event()
+
+        # counters and the moving average of the time between queueing and sending an event
+        self.sent_number = 0
+        self.dropped_number = 0
+        self.connections_number = 0
+        self.snapshots_number = 0
+        self.latency = 0.0
+
+        self.ws = None
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="WebSocketBrickHandler", daemon=True)
+        self.thread.start()
 
     def handle_new_brick(self, brick):
-        self.ws.send(json.dumps({
-            "event": "brick_added",
-            "data": {
-                "id": brick.object_id,
-                "position": brick.get_relative_position(),
-                "shape": str(brick.token.shape),
-                "color": str(brick.token.color)
-            }
-        }))
+        self.put_message({"event": "brick_added", "data": self.get_brick_data(brick)})
 
     def handle_removed_brick(self, brick):
-        self.ws.send(json.dumps({
-            "event": "brick_removed",
+        self.put_message({"event": "brick_removed", "data": self.get_brick_data(brick)})
+
+    # send all changes of a frame in one message if batch messages are enabled
+    def handle_brick_batch(self, added_bricks, removed_bricks):
+
+        if not self.batch_messages:
+            super().handle_brick_batch(added_bricks, removed_bricks)
+            return
+
+        self.put_message({
+            "event": "bricks_changed",
             "data": {
-                "id": brick.object_id,
-                "position": brick.get_relative_position(),
-                "shape": str(brick.token.shape),
-                "color": str(brick.token.color)
+                "added": [self.get_brick_data(brick) for brick in added_bricks],
+                "removed": [self.get_brick_data(brick) for brick in removed_bricks]
             }
-        }))
+        })
+
+    # returns true once after the LandscapeLab asked for a snapshot
+    def pop_snapshot_request(self) -> bool:
+
+        if not self.snapshot_requested.is_set():
+            return False
+
+        self.snapshot_requested.clear()
+        return True
+
+    # send all bricks currently on the table
+    def handle_brick_snapshot(self, bricks):
+
+        self.put_message({"event": "snapshot", "data": {"bricks": [self.get_brick_data(brick) for brick in bricks]}})
+        self.snapshots_number += 1
+
+    # returns the current state of the brick as sent to the LandscapeLab
+    @staticmethod
+    def get_brick_data(brick):
+
+        return {
+            "id": brick.object_id,
+            "position": brick.get_relative_position(),
+            "shape": str(brick.token.shape),
+            "color": str(brick.token.color)
+        }
+
+    # queue a message with the next sequence number
+    def put_message(self, message):
+
+        with self.events_condition:
+            self.sequence_number += 1
+            message["sequence"] = self.sequence_number
+
+            if len(self.events) >= self.queue_size:
+                self.events.popleft()
+                self.dropped_number += 1
+                logger.warning("brick event queue is full, dropped the oldest event")
+
+            self.events.append((time.perf_counter(), message))
+            self.events_condition.notify()
+
+    # send the queued events until the handler is closed
+    def run(self):
+
+        backoff = self.min_backoff
+
+        while self.running:
+
+            # (re)connect and wait longer after each failed attempt
+            if self.ws is None:
+                if not self.connect():
+                    with self.events_condition:
+                        self.events_condition.wait_for(lambda: not self.running, timeout=backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                backoff = self.min_backoff
+
+            # answer requests while waiting for events
+            if not self.receive():
+                self.disconnect()
+                continue
+
+            with self.events_condition:
+                self.events_condition.wait_for(lambda: self.events or not self.running, timeout=RECEIVE_INTERVAL)
+                if not self.running:
+                    break
+                if not self.events:
+                    continue
+                queue_time, message = self.events[0]
+
+            try:
+                self.ws.send(json.dumps(message))
+
+            except (websocket.WebSocketException, OSError) as e:
+                # keep the event and send it again after reconnecting
+                logger.warning("could not send brick event to {}: {}".format(self.url, e))
+                self.disconnect()
+                continue
+
+            with self.events_condition:
+                # the event may have been dropped meanwhile if the queue ran full
+                if self.events and self.events[0][1] is message:
+                    self.events.popleft()
+
+            self.sent_number += 1
+            latency = time.perf_counter() - queue_time
+            self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+
+    # read the requests of the LandscapeLab which already arrived, returns false if the connection was closed
+    def receive(self) -> bool:
+
+        try:
+            while select.select([self.ws.sock], [], [], 0)[0]:
+                opcode, data = self.ws.recv_data(control_frame=True)
+                if opcode == websocket.ABNF.OPCODE_CLOSE:
+                    logger.info("{} closed the connection".format(self.url))
+                    return False
+                if opcode == websocket.ABNF.OPCODE_TEXT:
+                    self.handle_request(data)
+
+        except (websocket.WebSocketException, OSError, ValueError) as e:
+            logger.warning("could not receive from {}: {}".format(self.url, e))
+            return False
+
+        return True
+
+    # handle a request of the LandscapeLab
+    def handle_request(self, data):
+
+        try:
+            request = json.loads(data)
+        except ValueError:
+            logger.warning("received an invalid request: {}".format(data))
+            return
+
+        if isinstance(request, dict) and request.get("event") == "get_snapshot":
+            logger.info("snapshot requested")
+            self.snapshot_requested.set()
+        else:
+            logger.debug("ignored request: {}".format(request))
+
+    # connect to the LandscapeLab, returns true on success
+    def connect(self) -> bool:
+
+        try:
+            self.ws = websocket.create_connection(self.url, timeout=self.timeout)
+            self.connections_number += 1
+            logger.info("connected to {}".format(self.url))
+            return True
+
+        except (websocket.WebSocketException, OSError) as e:
+            logger.debug("could not connect to {}: {}".format(self.url, e))
+            self.ws = None
+            return False
+
+    # close the connection after an error
+    def disconnect(self):
+
+        try:
+            self.ws.close()
+        except (websocket.WebSocketException, OSError):
+            pass
+        self.ws = None
+
+    # returns the queue depth, the counters and the average latency in milliseconds
+    def get_statistics(self):
+
+        return {
+            "queued": len(self.events),
+            "sequence": self.sequence_number,
+            "sent": self.sent_number,
+            "dropped": self.dropped_number,
+            "connections": self.connections_number,
+            "snapshots": self.snapshots_number,
+            "latency ms": round(self.latency * 1000, 2)
+        }
+
+    # stop the thread and close the connection
+    def close(self):
+
+        with self.events_condition:
+            self.running = False
+            self.events_condition.notify_all()
+        self.thread.join()
+
+        if self.ws is not None:
+            self.disconnect()
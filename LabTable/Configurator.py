@@ -20,6 +20,9 @@ class Configurator:
 
     def __init__(self, configfile="table-config.json"):
 
+        # Functions which are called after the config data was (re)loaded
+        self._refresh_callbacks = []
+
         # Load inital config data
         self._config_file = configfile
         self.refresh()
@@ -35,6 +38,13 @@ class Configurator:
             logger.exception("Error opening config file: {}".format(e))
             raise ConfigError("Could not load config data from {}".format(self._config_file))
 
+        for callback in self._refresh_callbacks:
+            callback()
+
+    # register a function which is called whenever the configuration file is reloaded
+    def add_refresh_callback(self, callback):
+        self._refresh_callbacks.append(callback)
+
     # Return searched json data
     def get(self, group, key=None):
 
@@ -6,6 +6,9 @@ class Board:
     # bottom_right_corner, bottom_left_corner]
     corners = None
 
+    # initialize the perspective transform matrix from the camera frame to the board
+    matrix = None
+
     # initialize distance to the board from the camera
     distance = None
 
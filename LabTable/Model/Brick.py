@@ -34,8 +34,6 @@ class BrickStatus(Enum):
     CANDIDATE_BRICK = 2
     OUTDATED_BRICK = 3
 
-icon_config = {}
-
 # this class represents a type of brick
 class Token:
 
@@ -43,12 +41,8 @@ class Token:
         self.shape: BrickShape = shape
         self.color: BrickColor = color
 
-        brick_format = (shape.name, str(color))
-        if svg == None and brick_format in icon_config:
-            self.svg = icon_config[brick_format]
-        else:
-            icon_config[brick_format] = svg
-            self.svg: str = svg
+        # the icon of this type of brick, the icons of a table are kept in its TableContext (token_icons)
+        self.svg: str = svg
 
     def __str__(self):
         return "{} | {}".format(self.shape, self.color)
@@ -71,6 +65,8 @@ class Brick:
     def __init__(self, centroid_x: int, centroid_y: int, token: Token):
         # the object_id which the brick has in the LandscapeLab (for external bricks)
         self.object_id = None
+        # the id of the track which follows this brick over the frames (for detected bricks)
+        self.track_id: Optional[int] = None
         self.relative_position = []
 
         # the x and y coordinates locally (in stream coordinates)
@@ -42,3 +42,7 @@ class CurrentProgramStage:
     def prev(self):
         self.current_stage = self.current_stage.prev_stage()
         logger.info("entering program stage: {}".format(self.current_stage))
+
+    def set(self, stage: ProgramStage):
+        self.current_stage = stage
+        logger.info("entering program stage: {}".format(self.current_stage))
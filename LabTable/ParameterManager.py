@@ -1,15 +1,18 @@
 import argparse
 
 
+# this class parses the command line arguments of a table,
+# these are the arguments of the process (sys.argv) unless a list of arguments is given
 class ParameterManager:
 
     used_stream = None
+    recalibrate = False
 
-    def __init__(self, config):
+    def __init__(self, config, arguments=None):
 
-        self.parse(config)
+        self.parse(config, arguments)
 
-    def parse(self, config):
+    def parse(self, config, arguments=None):
 
         # Parse optional parameters
         parser = argparse.ArgumentParser()
@@ -17,8 +20,10 @@ class ParameterManager:
         parser.add_argument("--ip", help="overwrites default server ip defined in config")
         parser.add_argument("--starting_location", type=str,
                             help="overwrites default starting location defined in config")
+        parser.add_argument("--recalibrate", action="store_true",
+                            help="ignores the stored calibration and detects the board again")
 
-        parser_arguments = parser.parse_args()
+        parser_arguments = parser.parse_args(arguments)
 
         if parser_arguments.usestream is not None:
             self.used_stream = parser_arguments.usestream
@@ -28,3 +33,5 @@ class ParameterManager:
 
         if parser_arguments.starting_location is not None:
             config.set("general", "starting_location", parser_arguments.starting_location)
+
+        self.recalibrate = parser_arguments.recalibrate
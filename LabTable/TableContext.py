@@ -0,0 +1,41 @@
+from typing import Dict, List, Optional
+
+from LabTable.ExtentTracker import ExtentTracker
+from LabTable.Model.Brick import Token
+
+# Default names of the windows of a table
+WINDOW_NAME_DEBUG = 'DEBUG WINDOW'
+WINDOW_NAME_BEAMER = 'BEAMER WINDOW'
+
+
+# this class holds the state which is shared by the parts of one table (board and beamer extents,
+# refresh flags, window names and arguments), so that the parts of several tables can be used side by side
+# in one process without interfering with each other
+# NOTE: the windows of all tables are driven from the main thread by run_tables in LabTable/__main__.py
+class TableContext:
+
+    def __init__(self, name: Optional[str] = None, config_file="table-config.json",
+                 arguments: Optional[List[str]] = None):
+
+        self.name = name
+
+        # each table can be configured with its own file (e.g. with another camera and beamer)
+        self.config_file = config_file
+
+        # the command line arguments of this table, None to use the arguments of the process (sys.argv)
+        self.arguments = arguments
+
+        # the extents of the board, the beamer and the map of this table
+        self.extent_tracker = ExtentTracker()
+
+        # set if the confirmed or virtual bricks changed and the beamer image has to be redrawn
+        self.bricks_refreshed = False
+        self.mouse_bricks_refreshed = False
+
+        # the icons of the tokens of this table by shape and color, set by the allowed tokens of the game mode
+        self.token_icons: Dict[Token, str] = {}
+
+        # the windows of named tables are suffixed with the name to keep them apart
+        suffix = "" if name is None else " ({})".format(name)
+        self.window_name_debug = WINDOW_NAME_DEBUG + suffix
+        self.window_name_beamer = WINDOW_NAME_BEAMER + suffix
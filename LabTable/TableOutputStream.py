@@ -10,7 +10,7 @@ from LabTable.BrickDetection.Tracker import Tracker
 from LabTable.Configurator import Configurator
 from LabTable.Model.Brick import Brick, BrickColor, BrickShape, BrickStatus, Token
 from LabTable.ImageHandler import ImageHandler
-from LabTable.ExtentTracker import ExtentTracker
+from LabTable.TableContext import TableContext
 from LabTable.Model.Extent import Extent
 from LabTable.Model.Board import Board
 
@@ -61,11 +61,6 @@ class TableOutputChannel(Enum):
 # this class handles the output video streams
 class TableOutputStream:
 
-    WINDOW_NAME_DEBUG = 'DEBUG WINDOW'
-    WINDOW_NAME_BEAMER = 'BEAMER WINDOW'
-
-    MOUSE_BRICKS_REFRESHED = False
-
     is_window_destroyed: bool = False
 
     def __init__(self,
@@ -73,15 +68,17 @@ class TableOutputStream:
                  config: Configurator,
                  board: Board,
                  program_stage: CurrentProgramStage,
+                 context: TableContext,
                  video_output_name=None):
 
         self.config = config
-        self.extent_tracker = ExtentTracker.get_instance()
+        self.context = context
+        self.extent_tracker = context.extent_tracker
         self.board = board
         self.program_stage = program_stage
 
         self.active_channel = TableOutputChannel.CHANNEL_BOARD_DETECTION
-        self.active_window = TableOutputStream.WINDOW_NAME_DEBUG
+        self.active_window = self.context.window_name_debug
 
         # create a store of the last images of each channel
         self.channel_images = {}
@@ -89,8 +86,8 @@ class TableOutputStream:
             self.channel_images[channel.name] = np.empty((1, 1))
 
         # create debug window
-        cv2.namedWindow(TableOutputStream.WINDOW_NAME_DEBUG, cv2.WINDOW_NORMAL)
-        cv2.resizeWindow(TableOutputStream.WINDOW_NAME_DEBUG, config.get("screen_resolution", "width"),
+        cv2.namedWindow(self.context.window_name_debug, cv2.WINDOW_NORMAL)
+        cv2.resizeWindow(self.context.window_name_debug, config.get("screen_resolution", "width"),
                          config.get("screen_resolution", "height"))
 
         # create beamer window
@@ -101,13 +98,13 @@ class TableOutputStream:
 
             logger.info("beamer coords: {} {}".format(pos_x, pos_y))
 
-            cv2.namedWindow(TableOutputStream.WINDOW_NAME_BEAMER, cv2.WND_PROP_FULLSCREEN)
-            cv2.moveWindow(TableOutputStream.WINDOW_NAME_BEAMER, pos_x, pos_y)
-            cv2.setWindowProperty(TableOutputStream.WINDOW_NAME_BEAMER, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+            cv2.namedWindow(self.context.window_name_beamer, cv2.WND_PROP_FULLSCREEN)
+            cv2.moveWindow(self.context.window_name_beamer, pos_x, pos_y)
+            cv2.setWindowProperty(self.context.window_name_beamer, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
         else:
-            cv2.namedWindow(TableOutputStream.WINDOW_NAME_BEAMER, cv2.WINDOW_AUTOSIZE)
+            cv2.namedWindow(self.context.window_name_beamer, cv2.WINDOW_AUTOSIZE)
 
-        cv2.setMouseCallback(TableOutputStream.WINDOW_NAME_BEAMER, self.beamer_mouse_callback)
+        cv2.setMouseCallback(self.context.window_name_beamer, self.beamer_mouse_callback)
 
         if video_output_name:
             # Define the codec and create VideoWriter object. The output is stored in .avi file.
@@ -149,7 +146,7 @@ class TableOutputStream:
 
     # fetches the correct monitor for the beamer output and writes it's data to the ConfigManager
     @staticmethod
-    def set_screen_config_info(config):
+    def set_screen_config_info(config, context: TableContext):
 
         monitors = screeninfo.get_monitors()
 
@@ -169,7 +166,7 @@ class TableOutputStream:
             config.set("beamer_resolution", "pos_x", beamer.x - 1)
             config.set("beamer_resolution", "pos_y", beamer.y - 1)
 
-            ExtentTracker.get_instance().beamer = Extent(0, 0, beamer.width, beamer.height)
+            context.extent_tracker.beamer = Extent(0, 0, beamer.width, beamer.height)
 
     # Write the frame into the file
     def write_to_file(self, frame):
@@ -201,6 +198,13 @@ class TableOutputStream:
         logger.debug("changed active channel one down")
         self.set_active_channel(self.active_channel.prev())
 
+    # write lines of debug information below the channel name into the frame
+    @staticmethod
+    def write_debug_lines(frame, lines: List[str]):
+        for line_number, line in enumerate(lines, start=1):
+            cv2.putText(frame, line, (POSITION_X, POSITION_Y + line_number * LINE_HEIGHT),
+                        cv2.FONT_HERSHEY_SIMPLEX, FONT_SIZE, GREEN, FONT_THICKNESS)
+
     # mark the candidate in given frame
     @staticmethod
     def mark_candidates(frame, candidate_contour):
@@ -224,8 +228,8 @@ class TableOutputStream:
         # Draw brick centroid points
         cv2.circle(frame, tracked_brick_position, RADIUS, GREEN, cv2.FILLED)
 
-    # called every frame, updates the beamer image and recognizes and handles button presses
-    def update(self, program_stage: CurrentProgramStage) -> bool:
+    # called every frame, updates the beamer image and the debug window
+    def update(self, program_stage: CurrentProgramStage):
 
         # update beamer image if necessary
         self.redraw_beamer_image(program_stage)
@@ -233,6 +237,11 @@ class TableOutputStream:
         # redraw debug window
         cv2.imshow(self.active_window, self.channel_images[self.active_channel.name])
 
+    # called once per loop for all tables, handles the window events (e.g. mouse clicks) and button presses
+    # returns true if the program should quit
+    @staticmethod
+    def check_quit_key() -> bool:
+
         # check if key pressed
         key = cv2.waitKeyEx(1)
 
@@ -254,7 +263,7 @@ class TableOutputStream:
 
         else:
             if self.is_window_destroyed: return
-            cv2.destroyWindow(TableOutputStream.WINDOW_NAME_BEAMER)
+            cv2.destroyWindow(self.context.window_name_beamer)
             self.is_window_destroyed = True
 
     # displays a white screen so that the board detector can more easily detect the qr-codes later
@@ -265,7 +274,7 @@ class TableOutputStream:
             self.config.get("beamer_resolution", "width"),
             4
         ]) * 255
-        cv2.imshow(TableOutputStream.WINDOW_NAME_BEAMER, frame)
+        cv2.imshow(self.context.window_name_beamer, frame)
         self.last_frame = frame
 
     # displays qr-codes in each corner for the detection of the game board dimensions
@@ -287,7 +296,7 @@ class TableOutputStream:
         ImageHandler.img_on_background(frame, self.qr_top_right, pos_top_right)
         ImageHandler.img_on_background(frame, self.qr_bottom_left, pos_bottom_left)
         ImageHandler.img_on_background(frame, self.qr_bottom_right, pos_bottom_right)
-        cv2.imshow(TableOutputStream.WINDOW_NAME_BEAMER, frame)
+        cv2.imshow(self.context.window_name_beamer, frame)
 
     # checks if the frame has updated and redraws it if this is the case
     # called every frame when running the actual game
@@ -296,8 +305,8 @@ class TableOutputStream:
         # check flags if any part of the frame has changed
         if self.config.get("map_settings", 'map_refreshed') \
                 or self.config.get("ui_settings", "ui_refreshed") \
-                or Tracker.BRICKS_REFRESHED \
-                or TableOutputStream.MOUSE_BRICKS_REFRESHED:
+                or self.context.bricks_refreshed \
+                or self.context.mouse_bricks_refreshed:
 
             # get map image from map handler
             resolution_x = int(self.config.get("beamer_resolution", "width"))
@@ -312,14 +321,14 @@ class TableOutputStream:
             self.render_bricks(frame)
 
             # display and save frame
-            cv2.imshow(TableOutputStream.WINDOW_NAME_BEAMER, frame)
+            cv2.imshow(self.context.window_name_beamer, frame)
             self.last_frame = frame
 
             # reset flags
             self.config.set("map_settings", "map_refreshed", False)
             self.config.set("ui_settings", "ui_refreshed", False)
-            Tracker.BRICKS_REFRESHED = False
-            TableOutputStream.MOUSE_BRICKS_REFRESHED = False
+            self.context.bricks_refreshed = False
+            self.context.mouse_bricks_refreshed = False
 
     # renders only external virtual bricks
     # since they should be displayed behind the ui unlike any other brick types
@@ -327,8 +336,8 @@ class TableOutputStream:
         # render bricks on top of transparent overlay_target
         overlay_target = render_target.copy()
 
-        # filter external bricks out of the virtual brick list and iterate over them
-        for brick in filter(lambda b: b.status == BrickStatus.EXTERNAL_BRICK, self.tracker.virtual_bricks):
+        # iterate over the external virtual bricks
+        for brick in self.tracker.virtual_bricks.get_by_status(BrickStatus.EXTERNAL_BRICK):
             self.render_brick(brick, overlay_target, True)
 
         # add overlay_target to render_target with alpha_value
@@ -345,7 +354,7 @@ class TableOutputStream:
         # render virtual bricks on top of transparent overlay_target
         overlay_target = render_target.copy()
         # iterate over all non-external virtual bricks and draw them to the overlay_target
-        for brick in list(filter(lambda b: b.status != BrickStatus.EXTERNAL_BRICK, self.tracker.virtual_bricks)):
+        for brick in self.tracker.virtual_bricks.get_except_status(BrickStatus.EXTERNAL_BRICK):
             self.render_brick(brick, overlay_target, True)
 
         # add overlay_target to render_target with alpha_value
@@ -380,15 +389,17 @@ class TableOutputStream:
             lookup_dict = self.virtual_icons if virtual else self.brick_icons 
 
             if hasattr(brick, "token"):# and brick.token.svg != "" and brick.token.svg != None:
+                # the detected bricks have no icon themselves, it is looked up by shape and color
+                svg = self.context.token_icons.get(brick.token, brick.token.svg)
                 try:
                     # This should actually not be the case but for safety reasons
-                    if not brick.token.svg in lookup_dict:
-                        return self.image_handler.load_image(brick.token.svg)
-                    return lookup_dict[brick.token.svg]
+                    if not svg in lookup_dict:
+                        return self.image_handler.load_image(svg)
+                    return lookup_dict[svg]
 
                 except Exception as e:
                     logger.error(
-                        "Could not load image with config identifier: {}".format(brick.token.svg))
+                        "Could not load image with config identifier: {}".format(svg))
                     logger.error("closing because encountered a problem: {}".format(e))
                     logger.exception(e)
                     return self.brick_unknown
@@ -399,8 +410,12 @@ class TableOutputStream:
     # closing the outputstream if it is defined
     def close(self):
         logger.info("closing table output stream")
-        logging.shutdown()
-        cv2.destroyAllWindows()
+
+        # close only the windows of this table, other tables of the process keep theirs
+        cv2.destroyWindow(self.context.window_name_debug)
+        if not self.is_window_destroyed:
+            cv2.destroyWindow(self.context.window_name_beamer)
+            self.is_window_destroyed = True
         if self.video_handler:
             self.video_handler.release()
 
@@ -431,7 +446,7 @@ class TableOutputStream:
                     self.tracker.remove_external_virtual_brick(virtual_brick)
                 else:
                     # otherwise add the mouse brick
-                    self.tracker.virtual_bricks.append(mouse_brick)
+                    self.tracker.add_virtual_brick(mouse_brick)
 
                 # set mouse brick refreshed flag
-                TableOutputStream.MOUSE_BRICKS_REFRESHED = True
+                self.context.mouse_bricks_refreshed = True
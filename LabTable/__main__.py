@@ -1,12 +1,20 @@
 import json
 import logging.config
-import numpy as np
+import time
+from typing import List
 
 from .Model.ProgramStage import ProgramStage, CurrentProgramStage
 from .BrickDetection.BoardDetector import BoardDetector
 from .BrickDetection.ShapeDetector import ShapeDetector
+from .BrickDetection.FrameCache import FrameCache
+from .BrickDetection.BrickColorTable import BrickColorTable
+from .BrickDetection.MotionGate import MotionGate
+from .BrickDetection.DepthSegmenter import DepthSegmenter
+from .BrickDetection.CalibrationCache import CalibrationCache
+from .BrickDetection.BoardDriftMonitor import BoardDriftMonitor
 from .InputStream.TableInputStream import TableInputStream
 from .TableOutputStream import TableOutputStream, TableOutputChannel
+from .TableContext import TableContext
 from .BrickDetection.Tracker import Tracker
 from .BrickHandling.WebSocket import WebSocketBrickHandler
 from .Configurator import Configurator
@@ -30,97 +38,138 @@ except Exception as e:
     logging.basicConfig(level=logging.INFO)
     logging.info("Could not initialize: logging.conf not found or misconfigured")
 
-# Number of RGB channels in
-# region of interest image
-CHANNELS_NUMBER = 3
 
-
-# this class manages the base workflow and handles the main loop
+# this class manages the base workflow of one table, each table gets its own context
+# several tables can run in one process with run_tables
 class LabTable:
 
-    def __init__(self):
+    def __init__(self, context: TableContext = None):
+
+        # Initialize the state shared by the parts of this table
+        self.context = context if context else TableContext()
 
         # Initialize config manager
-        self.config = Configurator()
-        TableOutputStream.set_screen_config_info(self.config)
+        self.config = Configurator(self.context.config_file)
+        TableOutputStream.set_screen_config_info(self.config, self.context)
 
         self.program_stage = CurrentProgramStage()
 
         # Initialize parameter manager and parse arguments
-        self.parser = ParameterManager(self.config)
+        self.parser = ParameterManager(self.config, self.context.arguments)
         self.used_stream = self.parser.used_stream
 
         # Initialize board detection
-        self.board_detector = BoardDetector(self.config)
+        self.board_detector = BoardDetector(self.config, self.context)
         self.board = self.board_detector.board
 
-        # Initialize the centroid tracker
-        self.tracker = Tracker(self.config, WebSocketBrickHandler())
+        # Compile the configured brick colors
+        self.color_table = BrickColorTable(self.config)
+
+        # Initialize the centroid tracker, its events are sent to the LandscapeLab in the background
+        self.brick_handler = WebSocketBrickHandler(self.config)
+        self.tracker = Tracker(self.config, self.brick_handler, self.color_table, self.context)
 
         # initialize the input and output stream
         self.output_stream = TableOutputStream(self.tracker,
-                                               self.config, self.board, self.program_stage)
+                                               self.config, self.board, self.program_stage, self.context)
         self.input_stream = TableInputStream.get_table_input_stream(self.config, self.board, usestream=self.used_stream)
 
+        # initialize the cache for images derived from the region of interest
+        self.frame_cache = FrameCache()
+
         # initialize the brick detector
-        self.shape_detector = ShapeDetector(self.config, self.output_stream)
+        self.shape_detector = ShapeDetector(self.config, self.output_stream, self.frame_cache, self.color_table)
+
+        # only detect bricks in the changed parts of the board if incremental detection is enabled
+        self.motion_gate = None
+        if self.config.get("brick_detection", "incremental"):
+            self.motion_gate = MotionGate(self.config)
+
+        # only detect bricks in objects raised above the board if depth segmentation is enabled
+        self.depth_segmenter = None
+        if self.config.get("brick_detection", "depth_segmentation"):
+            self.depth_segmenter = DepthSegmenter(self.config, self.board)
+
+        # skip the calibration stages with a stored calibration unless a recalibration is requested
+        self.calibration_cache = CalibrationCache(self.config, self.context)
+        self.restore_calibration = not self.parser.recalibrate
 
-    # Run bricks detection and tracking code
+        # the stored calibration is checked once on the first frame after the camera exposure settled
+        self.calibration_settle_frames = self.config.get("calibration", "settle_frames")
+        self.calibration_frames_number = 0
+
+        # re-check the board calibration in the background during brick detection if enabled
+        self.drift_monitor = None
+        if self.config.get("board_drift", "enabled"):
+            self.drift_monitor = BoardDriftMonitor(self.config, self.board_detector, self.calibration_cache,
+                                                   self.shape_detector)
+
+    # Run bricks detection and tracking code until the program is quit
     def run(self):
+        run_tables([self])
 
-        # Initialize ROI as a black RGB-image
-        region_of_interest = np.zeros((self.config.get("video_resolution", "height"),
-                                       self.config.get("video_resolution", "width"), CHANNELS_NUMBER), np.uint8)
+    # returns true if the input stream of this table delivers frames
+    def is_initialized(self) -> bool:
+        return self.input_stream is not None and self.input_stream.is_initialized()
 
-        if self.input_stream and self.input_stream.is_initialized():
-            logger.info("initialized input stream")
+    # update the windows of this table, called by the thread which drives the OpenCV windows
+    def update_windows(self):
+        self.output_stream.update(self.program_stage)
 
-            try:
+    # handle the next frame of this table
+    def step(self):
 
-                # main loop which handles each frame
-                while not self.output_stream.update(self.program_stage):
+        # get the next frame
+        depth_image_3d, color_image = self.input_stream.get_frame()
 
-                    # get the next frame
-                    depth_image_3d, color_image = self.input_stream.get_frame()
+        # Add some additional information to the debug window
+        color_image_debug = color_image.copy()
 
-                    # Add some additional information to the debug window
-                    color_image_debug = color_image.copy()
+        # always write the current frame to the board detection channel
+        self.output_stream.write_to_channel(TableOutputChannel.CHANNEL_BOARD_DETECTION, color_image_debug)
 
-                    # always write the current frame to the board detection channel
-                    self.output_stream.write_to_channel(TableOutputChannel.CHANNEL_BOARD_DETECTION, color_image_debug)
+        # call different functions depending on program state
+        if self.program_stage.current_stage == ProgramStage.WHITE_BALANCE:
 
-                    # call different functions depending on program state
-                    if self.program_stage.current_stage == ProgramStage.WHITE_BALANCE:
+            # continue with the stored calibration if the camera still sees the same board,
+            # otherwise the board is calibrated from scratch
+            if self.restore_calibration:
+                self.calibration_frames_number += 1
+                if self.calibration_frames_number > self.calibration_settle_frames:
+                    self.restore_calibration = False
+                    if self.calibration_cache.restore(color_image, self.board_detector, self.shape_detector):
+                        self.output_stream.set_active_channel(TableOutputChannel.CHANNEL_ROI)
+                        self.program_stage.set(ProgramStage.INTERNAL_MODE)
 
-                        # calculate the average white image
-                        if self.board_detector.compute_background(color_image):
-                            # switch to next stage if finished
-                            self.program_stage.next()
+            # calculate the average white image
+            elif self.board_detector.compute_background(color_image):
+                # switch to next stage if finished
+                self.program_stage.next()
 
-                    # detect the corners by finding the qr-codes
-                    elif self.program_stage.current_stage == ProgramStage.FIND_CORNERS:
+        # detect the corners by finding the qr-codes
+        elif self.program_stage.current_stage == ProgramStage.FIND_CORNERS:
 
-                        # Compute distance to the board
-                        self.input_stream.get_distance_to_board()
+            # Compute distance to the board
+            self.input_stream.get_distance_to_board()
 
-                        # Find position of board corners
-                        all_board_corners_found = self.board_detector.detect_board(color_image, self.output_stream)
+            # Find position of board corners
+            all_board_corners_found = self.board_detector.detect_board(color_image, self.output_stream)
 
-                        # if all corners were found change channel and start next stage
-                        if all_board_corners_found:
-                            # Use distance to set possible brick size
-                            self.shape_detector.calculate_possible_brick_dimensions(self.board.distance)
+            # if all corners were found change channel and start next stage
+            if all_board_corners_found:
+                # Use distance to set possible brick size
+                self.shape_detector.calculate_possible_brick_dimensions(self.board.distance)
+                self.calibration_cache.save(self.board_detector, self.shape_detector)
 
-                            self.output_stream.set_active_channel(TableOutputChannel.CHANNEL_ROI)
-                            self.program_stage.next()
+                self.output_stream.set_active_channel(TableOutputChannel.CHANNEL_ROI)
+                self.program_stage.next()
 
-                    # do the general brick detection (for internal or external ProgramStage)
-                    else:
-                        self.do_brick_detection(region_of_interest, color_image)
+        # do the general brick detection (for internal or external ProgramStage)
+        else:
+            self.do_brick_detection(color_image, depth_image_3d)
 
-            except Exception as e:
-                logger.error("closing because encountered a problem: {}".format(e))
-                logger.exception(e)
+    # close the windows and streams and stop the background threads of this table
+    def close(self):
 
         # handle the output stream correctly
         if self.output_stream:
@@ -130,32 +179,106 @@ class LabTable:
         if self.input_stream:
             self.input_stream.close()
 
-    def do_brick_detection(self, region_of_interest, color_image):
-        # If the board is detected take only the region
-        # of interest and start brick detection
-
-        # Take only the region of interest from the color image
-        region_of_interest = self.board_detector.rectify_image(region_of_interest, color_image)
-        region_of_interest_debug = region_of_interest.copy()
+        # stop the background board drift checks
+        if self.drift_monitor:
+            self.drift_monitor.close()
 
-        # Initialize brick properties list
-        potential_bricks_list = []
+        # stop the detection workers
+        self.shape_detector.close()
 
-        # detect contours in area of interest
-        contours = self.shape_detector.detect_contours(region_of_interest)
+        # stop sending brick events
+        self.brick_handler.close()
 
-        # Loop over the contours
-        for contour in contours:
+    def do_brick_detection(self, color_image, depth_image=None):
+        # If the board is detected take only the region
+        # of interest and start brick detection
 
-            # Check if the contour is a brick candidate (shape and color can be detected)
-            brick_candidate = self.shape_detector.detect_brick(contour, region_of_interest)
+        # Apply a board calibration corrected by the drift monitor and hand the frame to it
+        drift_duration = 0.0
+        if self.drift_monitor:
+            start = time.perf_counter()
+            self.drift_monitor.apply_drift()
+            self.drift_monitor.submit(color_image)
+            drift_duration = time.perf_counter() - start
 
-            if brick_candidate:
-                # Update the properties list of all potential bricks which are found in the frame
-                potential_bricks_list.append(brick_candidate)
+        # Take only the region of interest from the color image
+        region_of_interest = self.board_detector.rectify_image(color_image)
+        region_of_interest_debug = region_of_interest.copy()
 
-                # mark potential brick contours
-                TableOutputStream.mark_candidates(region_of_interest_debug, contour)
+        # Drop the images derived from the previous frame
+        self.frame_cache.new_frame(region_of_interest)
+
+        # search only objects raised above the board (None is the whole area of interest)
+        searched_regions = None
+        if self.depth_segmenter and depth_image is not None:
+            depth_region_of_interest = self.board_detector.rectify_depth(depth_image)
+            if depth_region_of_interest is not None:
+                raised_mask = self.depth_segmenter.find_raised_mask(depth_region_of_interest)
+                if raised_mask is not None:
+                    self.frame_cache.set_mask(raised_mask)
+                    _, _, min_area, _ = self.shape_detector.get_brick_dimensions()
+                    searched_regions = self.depth_segmenter.find_raised_regions(raised_mask, min_area)
+
+        # detect brick candidates (shape and color can be detected) in area of interest
+        if self.motion_gate:
+
+            # search only the changed regions and keep the bricks found in the untouched ones
+            changed_regions = self.motion_gate.update(self.frame_cache.get_gray(region_of_interest))
+            searched_regions = ShapeDetector.intersect_regions(searched_regions, changed_regions)
+            potential_bricks_list, candidate_contours = \
+                self.shape_detector.detect_frame(region_of_interest, searched_regions)
+            potential_bricks_list, candidate_contours = \
+                self.motion_gate.merge(potential_bricks_list, candidate_contours)
+
+        else:
+            potential_bricks_list, candidate_contours = \
+                self.shape_detector.detect_frame(region_of_interest, searched_regions)
+
+        # mark potential brick contours
+        for contour in candidate_contours:
+            TableOutputStream.mark_candidates(region_of_interest_debug, contour)
+
+        # Log how often derived images were shared between the contours
+        cache_hits, cache_misses = self.frame_cache.pop_statistics()
+        logger.debug("frame cache: {} hits, {} misses".format(cache_hits, cache_misses))
+
+        # Show how many contours were found, left after removing duplicates and accepted as bricks
+        raw_contours, unique_contours, accepted_bricks = self.shape_detector.pop_statistics()
+        logger.debug("contours: {} raw, {} deduplicated, {} bricks".format(raw_contours, unique_contours,
+                                                                          accepted_bricks))
+        debug_lines = [
+            "raw contours: {}".format(raw_contours),
+            "deduplicated contours: {}".format(unique_contours),
+            "accepted bricks: {}".format(accepted_bricks)
+        ]
+
+        # Show the cost of the drift monitor in this frame (including an applied drift),
+        # of the last applied drift and of its last check in the background
+        if self.drift_monitor:
+            logger.debug("drift monitor: {:.2f} ms in this frame, {:.1f} ms for the last drift, "
+                         "{:.1f} ms for the last check".format(drift_duration * 1000,
+                                                               self.drift_monitor.apply_duration * 1000,
+                                                               self.drift_monitor.check_duration * 1000))
+            debug_lines.append("drift monitor: {:.2f} ms, last drift {:.1f} ms, last check {:.1f} ms, "
+                               "{} checks, {} drifts".format(drift_duration * 1000,
+                                                             self.drift_monitor.apply_duration * 1000,
+                                                             self.drift_monitor.check_duration * 1000,
+                                                             self.drift_monitor.checks_number,
+                                                             self.drift_monitor.drifts_number))
+
+        # Show the size of the tracker state, it should stay flat over a long run
+        tracker_statistics = ", ".join("{} {}".format(value, name)
+                                       for name, value in self.tracker.get_statistics().items())
+        logger.debug("tracker: {}".format(tracker_statistics))
+        debug_lines.append("tracker: {}".format(tracker_statistics))
+
+        # Show the state of the brick event queue
+        handler_statistics = ", ".join("{} {}".format(value, name)
+                                       for name, value in self.brick_handler.get_statistics().items())
+        logger.debug("brick events: {}".format(handler_statistics))
+        debug_lines.append("brick events: {}".format(handler_statistics))
+
+        TableOutputStream.write_debug_lines(region_of_interest_debug, debug_lines)
 
         # Compute tracked bricks dictionary using the centroid tracker and set of properties
         # Mark stored bricks virtual
@@ -175,6 +298,36 @@ class LabTable:
         return self.program_stage.current_stage
 
 
+# run the tables in the main thread until the program is quit with the Esc key
+# each loop updates the windows of all tables, reads the keys once and handles the next frame of every table,
+# so that all OpenCV windows are driven from the main thread
+def run_tables(tables: List[LabTable]):
+
+    running_tables = [table for table in tables if table.is_initialized()]
+    logger.info("initialized input streams of {} of {} tables".format(len(running_tables), len(tables)))
+
+    try:
+
+        # main loop which handles each frame
+        while running_tables:
+
+            for table in running_tables:
+                table.update_windows()
+
+            if TableOutputStream.check_quit_key():
+                break
+
+            for table in running_tables:
+                table.step()
+
+    except Exception as e:
+        logger.error("closing because encountered a problem: {}".format(e))
+        logger.exception(e)
+
+    for table in tables:
+        table.close()
+
+
 # execute the main class  ' TODO: meaningful rename
 if __name__ == '__main__':
     main = LabTable()